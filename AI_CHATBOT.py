@@ -1,17 +1,40 @@
-from chat_pdf import process_pdf, llm_query
+from chat_pdf import get_retrieval_engine
 import streamlit as st
 from chat_logic import *
 from Visualization import *
 import pandas as pd
-import csv
-import chardet
 import os
-import time     
-from data_analysis import analyze_dataset, convert_dates
+from profiling import profile_dataset
+from fingerprint import dataframe_fingerprint
+from file_loader import content_hash, load_stored_dataset, load_uploaded_file, stage_upload, uploaded_file_key
+from dataset_store import recent_datasets
+from sql_engine import preview_dataset, sql_available
+from providers import use_fake_provider
+from tracing import span
+from document_registry import DEFAULT_TENANT, DocumentRegistry, tenant_slug
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 model = None
-if GOOGLE_API_KEY:
+if GOOGLE_API_KEY or use_fake_provider():
     model = initialize_gemini(GOOGLE_API_KEY)
+
+@st.cache_resource
+def load_retrieval_engine():
+    # One Chroma client, embedding client and QA chain shared by every session
+    return get_retrieval_engine()
+
+def index_documents(engine, registry, entries):
+    # Each document is checked against the ingest manifest once per session; unchanged ones cost one file hash
+    indexed = st.session_state.setdefault("indexed_documents", set())
+    for entry in entries:
+        key = (entry["tenant"], entry["doc_id"])
+        if key not in indexed:
+            engine.ingest_document(entry)
+            registry.mark_indexed(entry["tenant"], entry["doc_id"])
+            indexed.add(key)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_profile(fingerprint, mode, outlier_method, stratify_by, _df):
+    return profile_dataset(_df, mode=mode, outlier_method=outlier_method, stratify_by=stratify_by)
 # Run command: streamlit run rag_app.py
 os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 # Page configuration
@@ -33,6 +56,7 @@ Empower your business with cutting-edge AI features:
 """)
 st.sidebar.title("Our Features ⚙️ ")
 option = st.sidebar.radio("Choose a page:", ["About our system", "Analyse Reports", "Extract Data from Database"])
+stream_responses = st.sidebar.toggle("Stream responses", value=True)
 # Divider for clarity
 st.divider()
 if option == "About our system":
@@ -43,27 +67,67 @@ if option == "About our system":
     st.markdown("**A welcome from Nexus!🧠**")
 #__________________________ABOUT THE SYSTEM____________________________________________________________-________
     file_path = "AI.pdf"
-    # Use the hardcoded file path      
-    setup_chat_history()
-    if "chat_history" in st.session_state:
-        for chat in st.session_state.chat_history:
+    registry = DocumentRegistry()
+    tenant = tenant_slug(st.sidebar.text_input("Workspace", value=DEFAULT_TENANT, help="Documents and their search index are kept separate per workspace"))
+    # The bundled overview belongs to the default workspace
+    if os.path.exists(file_path) and "bundled_document" not in st.session_state:
+        with open(file_path, "rb") as f:
+            bundled, replaced = registry.add_file(DEFAULT_TENANT, content_hash(f.read()), file_path)
+        # An edited AI.pdf replaces the index of its previous version instead of sitting next to it
+        for entry in replaced:
+            load_retrieval_engine().remove_document(entry)
+        st.session_state.bundled_document = bundled
+    uploads = st.sidebar.file_uploader("Add PDF documents", type="pdf", accept_multiple_files=True)
+    removed = st.session_state.setdefault("removed_documents", set())
+    for upload in uploads or []:
+        doc_id = uploaded_file_key(upload)
+        # A removed document stays removed even while it is still listed in the uploader
+        if (tenant, doc_id) not in removed and registry.get(tenant, doc_id) is None:
+            registry.add_upload(tenant, doc_id, upload.name, upload.getvalue())
+    documents = {entry["doc_id"]: entry for entry in registry.documents(tenant)}
+    # Retrieval only searches the selected documents, so its cost follows the selection rather than the whole store
+    selected = st.sidebar.multiselect("Search in", list(documents), default=list(documents), format_func=lambda doc_id: documents[doc_id]["name"])
+    with st.sidebar.expander("Manage documents"):
+        for doc_id, entry in documents.items():
+            if st.button(f"Remove {entry['name']}", key=f"remove-{tenant}-{doc_id}"):
+                load_retrieval_engine().remove_document(entry)
+                registry.remove(tenant, doc_id)
+                st.session_state.setdefault("indexed_documents", set()).discard((tenant, doc_id))
+                removed.add((tenant, doc_id))
+                st.rerun()
+    history = setup_chat_history()
+    render_chat_history(history)
+    question = st.chat_input("Enter your question:")
+    if question and not selected:
+        st.warning("Add or select at least one document to ask about.")
+    elif question:
+        with span("pdf.turn", stream=stream_responses, documents=len(selected)) as turn:
+            remember_trace(turn)
             with st.chat_message("user"):
-                st.write(chat["input"])
+                st.write(question)
+                with st.status("Thinking......💡"):
+                    engine = load_retrieval_engine()
+                    index_documents(engine, registry, [documents[doc_id] for doc_id in selected])
+                    if not stream_responses:
+                        answer = engine.query(question, tenant=tenant, doc_ids=selected)
             with st.chat_message("assistant"):
-                st.write(chat["response"])
-    if question:= st.chat_input("Enter your question:"):
-        with st.chat_message("user"):
-            st.write(question)
-            with st.status("Thinking......💡"):
-                time.sleep(1)
-                vecorstore = process_pdf(file_path)
-                answer = llm_query(vecorstore, question)
-        with st.chat_message("assistant"):
-            result = answer.get('result', 'No result found.')
-            st.markdown(f"**Answer:** {result}")
-            st.session_state.chat_history.append({"input": question,"response": result})
+                if stream_responses:
+                    timing = {}
+                    st.markdown("**Answer:**")
+                    result = st.write_stream(timed_stream(engine.stream(question, tenant=tenant, doc_ids=selected), timing))
+                    if timing["ttft"] is not None:
+                        st.caption(f"⏱️ First token after {timing['ttft']:.2f}s, done in {timing['total']:.2f}s")
+                else:
+                    result = answer.get('result', 'No result found.')
+                    st.markdown(f"**Answer:** {result}")
+                    if answer.get("cached"):
+                        st.caption("⚡ Served from the answer cache")
+                history.append(question, result)
+    if GOOGLE_API_KEY or use_fake_provider():
+        cache_stats = load_retrieval_engine().answer_cache.stats()
+        st.sidebar.caption(f"Answer cache: {cache_stats['entries']} entries, {cache_stats['hit_rate']:.0%} hit rate")
     if st.sidebar.button("Clear Chat"):
-        st.session_state.chat_history = []
+        clear_chat_history()
 
 #__________________________CHAT WITH UPLOADED FILE________________________
 elif option == "Analyse Reports":
@@ -71,21 +135,42 @@ elif option == "Analyse Reports":
     st.markdown("**Explore your data in an _interactive_ way!**")
     st.divider()
     uploaded_file = st.file_uploader("Upload your CSV or XLSX report file", type=['csv', 'xlsx'])
+    run_sql = st.sidebar.toggle("Answer with SQL (DuckDB)", value=False, disabled=not sql_available(),
+                                help="Runs the generated SQL in DuckDB straight from the file on disk, without loading it into pandas; "
+                                     "suited to large reports. Profiling and charts need the pandas view.")
     df = None
-    result = None 
+    # Set instead of df when SQL mode reads the dataset from disk
+    dataset_key = None
     try:
         if uploaded_file is not None:
-            if uploaded_file.name.endswith('.csv'):
-                result = chardet.detect(uploaded_file.getvalue())
-                charenc = result['encoding']
-                dialect = csv.Sniffer().sniff(uploaded_file.getvalue().decode(charenc)[:1024], delimiters=[',', ';'])
-                delimiter = dialect.delimiter
-                df = pd.read_csv(uploaded_file, encoding=charenc, delimiter=delimiter, low_memory=False)
-            elif uploaded_file.name.endswith('.xlsx'):
-                df = pd.read_excel(uploaded_file, engine='openpyxl')
-                df = convert_dates(df)
+            key = uploaded_file_key(uploaded_file)
+            if run_sql and stage_upload(uploaded_file.name, key, uploaded_file):
+                dataset_key = key
+            else:
+                # Parsed once per upload and reused across reruns
+                df = load_uploaded_file(uploaded_file.name, key, uploaded_file)
+        else:
+            # Previously uploaded reports reopen from their columnar copy without re-parsing
+            recent = recent_datasets()
+            if recent:
+                labels = {entry["key"]: f"{entry['name']} ({entry['rows']:,} rows × {entry['columns']} columns)" for entry in recent}
+                selected_key = st.selectbox("Or reopen a recent dataset", [None] + list(labels), format_func=lambda key: "—" if key is None else labels[key])
+                if selected_key is not None and run_sql:
+                    dataset_key = selected_key
+                elif selected_key is not None:
+                    df = load_stored_dataset(selected_key)
+        if dataset_key is not None:
+            preview = preview_dataset(dataset_key)
     except Exception as e:
         st.error(f"Error reading file: {e}")
+        dataset_key = None
+    if dataset_key is not None:
+        with st.expander("Data Preview"):
+            st.dataframe(preview)
+        st.caption("SQL mode: questions are answered by DuckDB over the file on disk. Turn it off for profiling and charts.")
+        handle_chat_interface(None, GOOGLE_API_KEY, model, stream=stream_responses, execute_sql=True, dataset_key=dataset_key)
+        if st.sidebar.button("Clear Chat History"):
+            clear_chat_history()
     if df is not None:
         with st.expander("Data Preview"):
             st.dataframe(df.head(100))
@@ -96,18 +181,32 @@ elif option == "Analyse Reports":
             with st.expander("Data after getting dummies:"):
                 st.dataframe(df_converted.head(100))
         # Analyze dataset
+        outlier_method = st.selectbox("Outlier method", ["iqr", "zscore", "mad"], format_func=str.upper)
+        profile_mode = st.radio("Profiling mode", ["auto", "exact", "approximate"], horizontal=True,
+                                help="Approximate samples the rows and reports ± 95% error bounds; auto uses it above 5M rows")
+        stratify_by = None
+        if profile_mode != "exact":
+            # Text and category columns only: a stratum per distinct number would defeat the sample
+            strata = list(df.select_dtypes(include=["category", "object", "string", "bool"]).columns)
+            stratify_by = st.selectbox("Stratify sample by", [None] + strata, format_func=lambda col: "— (simple random sample)" if col is None else str(col),
+                                       help="Samples every group in proportion and keeps at least one row of rare groups")
         if st.button("Analyze Dataset"):
-            with st.spinner("Analyzing dataset..."):
-                with st.expander("DDataset info"):
-                    dataset_info = analyze_dataset(df)
-                    st.text_area("Dataset Analysis", dataset_info, height=400)
+            with span("analyze.turn", mode=profile_mode, outlier_method=outlier_method) as turn:
+                remember_trace(turn)
+                with st.spinner("Analyzing dataset..."):
+                    with st.expander("DDataset info"):
+                        profile = load_profile(dataframe_fingerprint(df), profile_mode, outlier_method, stratify_by, df)
+                        st.text_area("Dataset Analysis", profile.to_text(), height=400)
+                        st.caption(f"{profile.mode.capitalize()} profile computed in {profile.elapsed_seconds}s")
         # Chat interface
         setup_chat_history()
         if df is not None:
-                handle_chat_interface(df, GOOGLE_API_KEY, model)
+                handle_chat_interface(df, GOOGLE_API_KEY, model, stream=stream_responses, execute_sql=run_sql)
         if st.sidebar.button("Clear Chat History"):
             clear_chat_history()
         # Save response
         # Dropdowns for selecting x and y columns for plotting
         st.sidebar.subheader("Select Columns and Plot Type")
         visualize_data(df)
+# Per-turn timing of the latest question, analysis or chart on either page
+render_trace_panel()
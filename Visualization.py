@@ -11,17 +11,30 @@ import streamlit as st
 import io
 import pandas as pd
 import os
+import threading
+from collections import OrderedDict
+from fingerprint import dataframe_fingerprint, register_fingerprint
+from chart_data import MAX_POINTS, WEBGL_POINTS, aggregate_bar, downsample_line, histogram_bins
+from correlation import correlation_matrix, top_correlated
+from tracing import current_span, traced
+@traced("plot.generate_plot")
 def generate_plot(df, x_column, y_column, plot_type):
     if plot_type == "📈 Line Plot":
-        fig = px.line(df, x=x_column, y=y_column,
-                    title=f"Line Plot: {y_column} vs {x_column}")
+        # Large frames are reduced to MAX_POINTS with LTTB, which keeps the shape of the series
+        plot_df = downsample_line(df, x_column, y_column)
+        fig = px.line(plot_df, x=x_column, y=y_column,
+                    title=f"Line Plot: {y_column} vs {x_column}",
+                    render_mode="webgl" if len(plot_df) > WEBGL_POINTS else "auto")
         
         # Set the trace name to the y-column name directly
         fig.data[0].name = y_column
         st.sidebar.info("💡 Line plots work best with continuous data or time series")
     elif plot_type == "📊 Bar Plot":
-        fig = px.bar(df, x=x_column, y=y_column,
-                    title=f"Bar Plot: {y_column} vs {x_column}")
+        plot_df, truncated = aggregate_bar(df, x_column, y_column) if len(df) > MAX_POINTS else (df, False)
+        title = f"Bar Plot: {y_column} vs {x_column}"
+        if truncated:
+            title += f" (top {len(plot_df)})"
+        fig = px.bar(plot_df, x=x_column, y=y_column, title=title)
         # Set the trace name to the y-column name directly
         fig.data[0].name = y_column
         st.sidebar.info("💡 Bar plots work best with categorical X-axis data")
@@ -40,9 +53,18 @@ def generate_plot(df, x_column, y_column, plot_type):
     )
     
     return fig
+@traced("plot.histogram")
 def histogram(df, x_column,plot_type):
     if plot_type == "📉 Histogram":
-        fig = px.histogram(df, x=x_column, nbins=30, title=f"Histogram: {x_column}")
+        if len(df) > MAX_POINTS:
+            # Bin on the server and send only the bars, instead of every row for plotly.js to bin
+            bins = histogram_bins(df[x_column])
+            fig = px.bar(bins, x="bin", y="count", title=f"Histogram: {x_column}")
+            if bins["width"].notna().all():
+                fig.update_traces(width=bins["width"].tolist())
+            fig.update_layout(bargap=0)
+        else:
+            fig = px.histogram(df, x=x_column, nbins=30, title=f"Histogram: {x_column}")
                         
         # Set the trace name to the y-column name directly
         fig.data[0].name = x_column
@@ -59,19 +81,44 @@ def histogram(df, x_column,plot_type):
     )
     return fig
 
-def heat_map(df):
-    plt.figure(figsize=(10, 8))
+# Annotated seaborn heatmaps draw one text artist per cell; past this many columns plotly renders the matrix instead
+ANNOTATE_MAX_COLUMNS = 20
+DEFAULT_HEATMAP_COLUMNS = 30
+
+@traced("plot.heat_map")
+def heat_map(df, top_n=None):
+    # Returns a PNG buffer for small matrices, a plotly figure for large ones, or an error message
     try:
+        corr = top_correlated(correlation_matrix(df), top_n)
+        if len(corr) > ANNOTATE_MAX_COLUMNS:
+            fig = go.Figure(go.Heatmap(
+                z=corr.to_numpy(),
+                x=[str(col) for col in corr.columns],
+                y=[str(col) for col in corr.index],
+                zmin=-1, zmax=1, zmid=0,
+                colorscale="RdBu_r",
+                hovertemplate="%{y} / %{x}: %{z:.2f}<extra></extra>",
+            ))
+            fig.update_layout(
+                title="Correlation of the dataset",
+                template="plotly_dark",
+                height=max(500, 14 * len(corr)),
+                yaxis=dict(autorange="reversed"),
+            )
+            return fig
+        plt.figure(figsize=(10, 8))
         plt.title("Correlation of the dataset")
-        sns.heatmap(df.corr(), vmin=-1, vmax=1, center=0, annot=True, cmap='coolwarm', annot_kws={'fontsize': 8, 'fontweight': 'bold'}, cbar=False)
+        sns.heatmap(corr, vmin=-1, vmax=1, center=0, annot=True, cmap='coolwarm', annot_kws={'fontsize': 8, 'fontweight': 'bold'}, cbar=False)
         buf_heat = io.BytesIO()
         plt.savefig(buf_heat, format='png')
         buf_heat.seek(0)
         plt.close()
         return buf_heat
     except Exception as e:
+        plt.close()
         return f"Error generating heatmap: {e}"
 
+@traced("plot.pie_plot")
 def pie_plot(df, x_column):
     try:
         # Calculate value counts for the column
@@ -105,12 +152,85 @@ def pie_plot(df, x_column):
         return f"Error generating pie chart: {e}"
 
 # Data has categorical features
-def get_dummies(df):
-    categorical_cols = df.select_dtypes(include=['object']).columns
-    if len(categorical_cols) > 0:
-        for col in categorical_cols:
-            if df[col].isin(['yes', 'no', 'True', 'False']).any():
-                df[col] = df[col].map({'yes': 1, 'True': 1, 'no': 0, 'False': 0})
+BOOLEAN_VALUES = {'yes': 1, 'True': 1, 'no': 0, 'False': 0}
+# Columns with more distinct values keep their most frequent ones and fold the rest into OTHER_LABEL
+MAX_CATEGORIES = 50
+OTHER_LABEL = "__other__"
+MAX_ENCODED_FRAMES = 4
+
+def other_label(kept):
+    # The overflow label must not collide with a kept value, or the category list would hold it twice
+    label = OTHER_LABEL
+    while label in kept:
+        label += "_"
+    return label
+
+class CategoricalEncoder:
+    # Fitted mapping (column -> kept categories) that can be reapplied to new frames with the same columns
+    def __init__(self, max_categories=MAX_CATEGORIES, sparse=False, drop_first=True):
+        self.max_categories = max_categories
+        self.sparse = sparse
+        self.drop_first = drop_first
+        self.boolean_columns = []
+        self.categories = {}
+        # column -> label the values outside its kept categories are folded into
+        self.other_labels = {}
+
+    def fit(self, df):
+        self.boolean_columns = []
+        self.categories = {}
+        self.other_labels = {}
+        for col in df.select_dtypes(include=['object', 'category', 'string']).columns:
+            if df[col].isin(list(BOOLEAN_VALUES)).any():
+                self.boolean_columns.append(col)
+                continue
+            counts = df[col].value_counts()
+            if self.max_categories is not None and len(counts) > self.max_categories:
+                kept = sorted(map(str, counts.index[:self.max_categories]))
+                self.other_labels[col] = other_label(kept)
+                self.categories[col] = kept + [self.other_labels[col]]
             else:
-                df = pd.get_dummies(df, columns=[col], drop_first=True)
-    return df
+                self.categories[col] = sorted(map(str, counts.index))
+        return self
+
+    def transform(self, df):
+        # Dummy blocks are built per column from the small category codes and joined to the frame in a single concat
+        encoded = df.drop(columns=list(self.categories))
+        if self.boolean_columns:
+            encoded = encoded.assign(**{col: df[col].map(BOOLEAN_VALUES) for col in self.boolean_columns})
+        blocks = [encoded]
+        for col, categories in self.categories.items():
+            values = df[col].astype(str).where(df[col].notna())
+            if col in self.other_labels:
+                values = values.where(values.isin(categories) | values.isna(), self.other_labels[col])
+            codes = pd.Categorical(values, categories=categories)
+            dummies = pd.get_dummies(codes, prefix=str(col), drop_first=self.drop_first, sparse=self.sparse)
+            dummies.index = df.index
+            blocks.append(dummies)
+        return pd.concat(blocks, axis=1) if len(blocks) > 1 else encoded
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+_encoded_frames = OrderedDict()
+_encoded_lock = threading.Lock()
+
+@traced("data.get_dummies")
+def get_dummies(df, max_categories=MAX_CATEGORIES, sparse=False):
+    # Encoded frames are reused per dataset fingerprint, so repeated clicks and heatmap renders skip encoding
+    key = (dataframe_fingerprint(df), max_categories, sparse)
+    with _encoded_lock:
+        cached = key in _encoded_frames
+        current_span().set(**{"cache.hit": cached})
+        if cached:
+            _encoded_frames.move_to_end(key)
+            return _encoded_frames[key][1]
+    encoder = CategoricalEncoder(max_categories=max_categories, sparse=sparse)
+    encoded = encoder.fit_transform(df)
+    # Lets the correlation cache key the encoded frame without hashing it
+    register_fingerprint(encoded, f"{key[0]}-dummies-{max_categories}-{int(sparse)}")
+    with _encoded_lock:
+        _encoded_frames[key] = (encoder, encoded)
+        while len(_encoded_frames) > MAX_ENCODED_FRAMES:
+            _encoded_frames.popitem(last=False)
+    return encoded
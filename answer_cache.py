@@ -0,0 +1,97 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+# ________________________________________________________ANSWER CACHE____________________________________________
+MAX_ENTRIES = 256
+TTL_SECONDS = 60 * 60
+SIMILARITY_THRESHOLD = 0.92
+
+def normalize_question(question):
+    question = unicodedata.normalize("NFKC", str(question)).casefold()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip(" ?!.。")
+
+class AnswerCache:
+    # Answers keyed by (normalized question, document/dataframe fingerprint), evicted by TTL and LRU.
+    # With an embedding_function, a miss falls back to the closest cached question for the same fingerprint.
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_seconds=TTL_SECONDS, embedding_function=None, similarity_threshold=SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.embedding_function = embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry["created"] > self.ttl_seconds
+
+    def _embed(self, normalized):
+        vector = np.asarray(self.embedding_function.embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, fingerprint):
+        key = (normalize_question(question), fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+            candidates = [(k, e) for k, e in self.entries.items() if k[1] == fingerprint and e["vector"] is not None and not self._expired(e, now)]
+        if self.embedding_function is None or not candidates:
+            with self._lock:
+                self.misses += 1
+            return None
+        # Embedding call happens outside the lock; the vector is kept for the put() that follows a miss
+        vector = self._embed(key[0])
+        scores = np.stack([e["vector"] for _, e in candidates]) @ vector
+        best = int(np.argmax(scores))
+        with self._lock:
+            self._vectors[key] = vector
+            if len(self._vectors) > self.max_entries:
+                self._vectors.pop(next(iter(self._vectors)))
+            if scores[best] >= self.similarity_threshold and candidates[best][0] in self.entries:
+                self.entries.move_to_end(candidates[best][0])
+                self.semantic_hits += 1
+                return candidates[best][1]["value"]
+            self.misses += 1
+        return None
+
+    def put(self, question, fingerprint, value):
+        key = (normalize_question(question), fingerprint)
+        with self._lock:
+            vector = self._vectors.pop(key, None)
+        if vector is None and self.embedding_function is not None:
+            vector = self._embed(key[0])
+        with self._lock:
+            self.entries[key] = {"value": value, "vector": vector, "created": time.monotonic()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._vectors.clear()
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
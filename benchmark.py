@@ -0,0 +1,503 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import chromadb
+import numpy as np
+import pandas as pd
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from chat_pdf import CHAT_MODEL, COLLECTION_NAME, RetrievalEngine, build_qa_chain
+from embedding_pipeline import EmbeddingPipeline
+from data_analysis import analyze_dataset, count_outliers
+from file_loader import parse_file
+from schema_inference import apply_schema, infer_schema
+from Visualization import CategoricalEncoder, generate_plot, get_dummies, heat_map, histogram, pie_plot
+from figure_cache import figure_size
+from dataset_store import arrow_safe
+from sql_engine import DatasetDatabase
+from tracing import estimate_tokens
+from providers import PROVIDER, FakeChatModel, FakeEmbeddings, chat_model
+# Run command: python benchmark.py retrieval --chunks 200 --questions 50 --threads 4
+# Full suite:  python benchmark.py --output bench.json suite --sizes 10000 100000 1000000
+WORDS = ["revenue", "customer", "segment", "report", "forecast", "churn", "region", "product", "margin", "quarter"]
+QUESTIONS = ["What does Nexus do?", "Which reports can I analyse?", "How is customer churn measured?", "Tóm tắt hệ thống"]
+DATA_SIZES = [10_000, 100_000, 1_000_000]
+# Synthetic corpus for the context benchmark: filler text with one topic's terms per chunk
+TOPICS = {
+    "churn": "churn retention cancellation cohort subscriber renewal",
+    "revenue": "revenue invoice billing pricing discount margin",
+    "forecast": "forecast seasonality trend projection baseline horizon",
+    "region": "region country warehouse shipping logistics delivery",
+}
+TOPIC_QUESTIONS = ["How is churn and retention measured?", "What drives revenue and margin?",
+                   "How does the forecast handle seasonality?", "Which region has shipping delays?"]
+PLOT_TYPES = ["📈 Line Plot", "📊 Bar Plot", "📉 Histogram", "🥧 Pie Chart", "🌡️ Heatmap"]
+
+def summarize(samples_ms):
+    samples_ms = sorted(samples_ms)
+    return {
+        "runs": len(samples_ms),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+        "p50_ms": round(samples_ms[len(samples_ms) // 2], 3),
+        "p95_ms": round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))], 3),
+    }
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+def cold_warm(fn, *args, repeats=3):
+    # First call separately: it pays for whatever the later calls find in a cache
+    cold = timed(fn, *args)
+    return {"cold_ms": round(cold, 3), "warm": summarize([timed(fn, *args) for _ in range(repeats)])}
+
+def run_many(fn, questions, threads):
+    if threads <= 1:
+        return [timed(fn, q) for q in questions]
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(lambda q: timed(fn, q), questions))
+
+def synthetic_documents(num_chunks, words_per_chunk=300):
+    documents = []
+    for i in range(num_chunks):
+        text = " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(words_per_chunk))
+        documents.append(Document(page_content=f"Section {i}. {text}", metadata={"source": "synthetic.pdf", "chunk": i}))
+    return documents
+
+def topical_documents(num_chunks, words_per_chunk=300):
+    topics = list(TOPICS)
+    documents = []
+    for i in range(num_chunks):
+        topic = topics[i % len(topics)]
+        filler = " ".join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(words_per_chunk - 30))
+        documents.append(Document(page_content=f"Section {i}. {filler} {' '.join([TOPICS[topic]] * 5)}",
+                                  metadata={"source": "topics.pdf", "chunk": i}))
+    return documents
+
+# ____________________________RETRIEVAL OVERHEAD____________________________
+# The fake chat model answers instantly, so the timings are everything around the model call.
+def bench_retrieval(num_chunks=200, num_questions=50, threads=1):
+    persist_path = tempfile.mkdtemp(prefix="bench_chroma_")
+    embedding = FakeEmbeddings(latency_seconds=0)
+    # Numbered questions so the shared engine is measured on answer cache misses, like the per-call path
+    questions = [f"{QUESTIONS[i % len(QUESTIONS)]} #{i}" for i in range(num_questions)]
+    try:
+        # Vector mode, so both sides do the same top-k search and only construction cost differs; bench_context compares the retrieval modes
+        engine = RetrievalEngine(persist_path=persist_path, llm=FakeChatModel(latency_seconds=0, token_latency_seconds=0), embedding_function=embedding,
+                                 retrieval_mode="vector")
+        documents = synthetic_documents(num_chunks)
+        engine.vectorstore.add_documents(documents=documents, ids=[f"chunk-{i}" for i in range(len(documents))])
+
+        def per_call_construction(question):
+            # What llm_query used to do on every question
+            try:
+                chat_model(CHAT_MODEL, temperature=0, google_api_key=os.getenv("GOOGLE_API_KEY", "benchmark"))
+            except Exception:
+                pass
+            vectorstore = Chroma(
+                client=chromadb.PersistentClient(path=persist_path),
+                collection_name=COLLECTION_NAME,
+                embedding_function=embedding,
+            )
+            build_qa_chain(FakeChatModel(latency_seconds=0, token_latency_seconds=0), vectorstore).invoke(question)
+
+        legacy = summarize(run_many(per_call_construction, questions, threads))
+        shared = summarize(run_many(engine.query, questions, threads))
+        return {
+            "benchmark": "retrieval_overhead",
+            "chunks": num_chunks,
+            "threads": threads,
+            "per_call_construction": legacy,
+            "shared_engine": shared,
+            "speedup": round(legacy["mean_ms"] / shared["mean_ms"], 2) if shared["mean_ms"] else None,
+        }
+    finally:
+        shutil.rmtree(persist_path, ignore_errors=True)
+
+# ____________________________RETRIEVAL QA____________________________
+# End to end through RetrievalEngine with the offline chat model: retrieval, prompt, model latency and the answer cache
+def bench_qa(corpus_sizes=(200, 2000), num_questions=20, latency_seconds=0.5, token_latency_seconds=0.02):
+    results = {"benchmark": "retrieval_qa", "latency_seconds": latency_seconds, "token_latency_seconds": token_latency_seconds, "corpora": []}
+    for num_chunks in corpus_sizes:
+        persist_path = tempfile.mkdtemp(prefix="bench_chroma_")
+        try:
+            llm = FakeChatModel(latency_seconds=latency_seconds, token_latency_seconds=token_latency_seconds)
+            engine = RetrievalEngine(persist_path=persist_path, llm=llm, embedding_function=FakeEmbeddings(latency_seconds=0))
+            documents = synthetic_documents(num_chunks)
+            engine.pipeline.run(documents, [f"chunk-{i}" for i in range(len(documents))], vectorstore=engine.vectorstore)
+            # Numbered questions so every call misses the answer cache
+            questions = [f"{QUESTIONS[i % len(QUESTIONS)]} #{i}" for i in range(num_questions)]
+            uncached = [timed(engine.query, q) for q in questions]
+            cached = [timed(engine.query, q) for q in questions]
+            first_token = []
+            for q in questions:
+                start = time.perf_counter()
+                for token in engine.stream(f"{q} (stream)"):
+                    if token:
+                        first_token.append((time.perf_counter() - start) * 1000)
+                        break
+            results["corpora"].append({
+                "chunks": num_chunks,
+                "query": summarize(uncached),
+                "query_cached": summarize(cached),
+                "stream_first_token": summarize(first_token),
+            })
+        finally:
+            shutil.rmtree(persist_path, ignore_errors=True)
+    return results
+
+# ____________________________RETRIEVED CONTEXT____________________________
+# Prompt size and answer latency of plain top-k vector retrieval vs hybrid retrieval with adaptive k and a token budget.
+# The fake chat model charges per prompt token, so a smaller context shows up as a faster answer.
+def bench_context(pdf_paths=None, num_chunks=200, latency_seconds=0.3, prompt_token_latency_seconds=0.0002, repeats=3):
+    persist_path = tempfile.mkdtemp(prefix="bench_chroma_")
+    try:
+        llm = FakeChatModel(latency_seconds=latency_seconds, prompt_token_latency_seconds=prompt_token_latency_seconds, token_latency_seconds=0)
+        engine = RetrievalEngine(persist_path=persist_path, llm=llm, embedding_function=FakeEmbeddings(latency_seconds=0))
+        if pdf_paths:
+            for path in pdf_paths:
+                engine.ingest(path)
+            questions = QUESTIONS
+        else:
+            documents = topical_documents(num_chunks)
+            engine.pipeline.run(documents, [f"chunk-{i}" for i in range(len(documents))], vectorstore=engine.vectorstore)
+            questions = TOPIC_QUESTIONS
+        results = {"benchmark": "retrieved_context", "corpus": pdf_paths or f"{num_chunks} synthetic chunks",
+                   "latency_seconds": latency_seconds, "prompt_token_latency_seconds": prompt_token_latency_seconds, "modes": {}}
+        for mode in ("vector", "hybrid"):
+            engine.retrieval_mode = mode
+            prompt_tokens, chunks, retrieve_ms, answer_ms = [], [], [], []
+            for _ in range(repeats):
+                for question in questions:
+                    start = time.perf_counter()
+                    documents = engine.retriever_for().invoke(question)
+                    retrieved = time.perf_counter()
+                    messages = engine.prompt.format_messages(context="\n\n".join(doc.page_content for doc in documents), question=question)
+                    engine.llm.invoke(messages)
+                    retrieve_ms.append((retrieved - start) * 1000)
+                    answer_ms.append((time.perf_counter() - start) * 1000)
+                    prompt_tokens.append(estimate_tokens(messages[-1].content))
+                    chunks.append(len(documents))
+            results["modes"][mode] = {
+                "prompt_tokens_mean": round(statistics.fmean(prompt_tokens), 1),
+                "chunks_mean": round(statistics.fmean(chunks), 2),
+                "retrieve": summarize(retrieve_ms),
+                "answer": summarize(answer_ms),
+            }
+        vector, hybrid = results["modes"]["vector"], results["modes"]["hybrid"]
+        results["prompt_token_reduction"] = round(1 - hybrid["prompt_tokens_mean"] / vector["prompt_tokens_mean"], 3)
+        results["answer_speedup"] = round(vector["answer"]["mean_ms"] / hybrid["answer"]["mean_ms"], 2)
+        return results
+    finally:
+        shutil.rmtree(persist_path, ignore_errors=True)
+
+# ____________________________PDF INGEST____________________________
+def bench_ingest(pdf_path, latency_seconds=0.2):
+    persist_path = tempfile.mkdtemp(prefix="bench_chroma_")
+    try:
+        engine = RetrievalEngine(persist_path=persist_path, llm=FakeChatModel(), embedding_function=FakeEmbeddings(latency_seconds=latency_seconds))
+        cold = timed(engine.ingest, pdf_path)
+        stats = engine.last_ingest_stats
+        # Unchanged file: the manifest short-circuits loading, splitting and embedding
+        warm = summarize([timed(engine.ingest, pdf_path) for _ in range(3)])
+        return {
+            "benchmark": "pdf_ingest",
+            "pdf": pdf_path,
+            "size_bytes": os.path.getsize(pdf_path),
+            "latency_seconds": latency_seconds,
+            "cold_ms": round(cold, 3),
+            "embedding": stats,
+            "unchanged": warm,
+        }
+    finally:
+        shutil.rmtree(persist_path, ignore_errors=True)
+
+# ____________________________EMBEDDING THROUGHPUT____________________________
+def bench_embedding(num_chunks=1000, batch_size=32, max_workers=4, texts_per_second=None, latency_seconds=0.2):
+    persist_path = tempfile.mkdtemp(prefix="bench_chroma_")
+    embedding = FakeEmbeddings(latency_seconds=latency_seconds)
+    documents = synthetic_documents(num_chunks)
+    ids = [f"chunk-{i}" for i in range(len(documents))]
+    try:
+        vectorstore = Chroma(client=chromadb.PersistentClient(path=persist_path), collection_name=COLLECTION_NAME, embedding_function=embedding)
+        serial = EmbeddingPipeline(embedding, batch_size=batch_size, max_workers=1, texts_per_second=texts_per_second)
+        concurrent = EmbeddingPipeline(embedding, batch_size=batch_size, max_workers=max_workers, texts_per_second=texts_per_second)
+        return {
+            "benchmark": "embedding_throughput",
+            "chunks": num_chunks,
+            "batch_size": batch_size,
+            "latency_seconds": latency_seconds,
+            "serial": serial.run(documents, ids, vectorstore=vectorstore),
+            "concurrent": dict(concurrent.run(documents, ids, vectorstore=vectorstore), workers=max_workers),
+        }
+    finally:
+        shutil.rmtree(persist_path, ignore_errors=True)
+
+# ____________________________OUTLIER DETECTION____________________________
+def legacy_count_outliers(df):
+    # The per-column loop detect_outliers used before it was vectorized
+    outliers_summary = {}
+    for col in df.select_dtypes(include=['float64', 'int64']).columns:
+        Q1 = df[col].quantile(0.25)
+        Q3 = df[col].quantile(0.75)
+        IQR = Q3 - Q1
+        outliers_summary[col] = df[(df[col] < Q1 - 1.5 * IQR) | (df[col] > Q3 + 1.5 * IQR)].shape[0]
+    return outliers_summary
+
+def synthetic_frame(rows, columns, seed=0):
+    rng = np.random.default_rng(seed)
+    # Heavy-tailed values so there are outliers to count
+    return pd.DataFrame(rng.standard_t(3, size=(rows, columns)), columns=[f"col_{i}" for i in range(columns)])
+
+def bench_outliers(wide_rows=10_000, wide_columns=500, tall_rows=10_000_000, tall_columns=4, repeats=3):
+    results = {"benchmark": "outlier_detection", "frames": []}
+    for label, rows, columns in (("wide", wide_rows, wide_columns), ("tall", tall_rows, tall_columns)):
+        df = synthetic_frame(rows, columns)
+        legacy = summarize([timed(legacy_count_outliers, df) for _ in range(repeats)])
+        vectorized = {method: summarize([timed(count_outliers, df, method) for _ in range(repeats)]) for method in ("iqr", "zscore", "mad")}
+        results["frames"].append({
+            "shape": label,
+            "rows": rows,
+            "columns": columns,
+            "legacy_iqr": legacy,
+            "vectorized": vectorized,
+            "speedup_iqr": round(legacy["mean_ms"] / vectorized["iqr"]["mean_ms"], 2),
+        })
+        del df
+    return results
+
+# ____________________________DATA PATHS____________________________
+def mixed_frame(rows, seed=0):
+    # Shaped like a sales report: date strings, low- and mid-cardinality text, yes/no flags and heavy-tailed numbers
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="min").strftime("%Y-%m-%d %H:%M"),
+        "region": rng.choice(["north", "south", "east", "west"], rows),
+        "product": rng.choice([f"product_{i}" for i in range(40)], rows),
+        "churned": rng.choice(["yes", "no"], rows),
+        "units": rng.integers(0, 500, rows),
+        "revenue": rng.standard_t(3, rows) * 100 + 1000,
+        "margin": rng.normal(0.2, 0.05, rows),
+    })
+
+def loaded_frame(rows):
+    # What load_uploaded_file hands to the rest of the app
+    df = mixed_frame(rows)
+    return apply_schema(df, infer_schema(df))
+
+def bench_csv_load(sizes=DATA_SIZES, repeats=3):
+    results = {"benchmark": "csv_load", "sizes": []}
+    for rows in sizes:
+        data = mixed_frame(rows).to_csv(index=False).encode("utf-8")
+        parsed = parse_file("bench.csv", data)
+        results["sizes"].append({
+            "rows": rows,
+            "size_bytes": len(data),
+            "parse": summarize([timed(parse_file, "bench.csv", data) for _ in range(repeats)]),
+            "infer_schema": summarize([timed(infer_schema, parsed) for _ in range(repeats)]),
+        })
+    return results
+
+def bench_analyze(sizes=DATA_SIZES, repeats=3):
+    results = {"benchmark": "analyze_dataset", "sizes": []}
+    for rows in sizes:
+        df = loaded_frame(rows)
+        results["sizes"].append({
+            "rows": rows,
+            "exact": summarize([timed(analyze_dataset, df, "iqr", "exact") for _ in range(repeats)]),
+            "approximate": summarize([timed(analyze_dataset, df, "iqr", "approximate") for _ in range(repeats)]),
+        })
+    return results
+
+def bench_dummies(sizes=DATA_SIZES, repeats=3):
+    results = {"benchmark": "get_dummies", "sizes": []}
+    for rows in sizes:
+        df = loaded_frame(rows)
+        encoded = get_dummies(df)
+        results["sizes"].append({
+            "rows": rows,
+            "encoded_columns": int(encoded.shape[1]),
+            "encode": summarize([timed(CategoricalEncoder().fit_transform, df) for _ in range(repeats)]),
+            "cached": summarize([timed(get_dummies, df) for _ in range(repeats)]),
+        })
+    return results
+
+def build_plot(df, plot_type):
+    if plot_type == "📈 Line Plot":
+        return generate_plot(df, "date", "revenue", plot_type)
+    if plot_type == "📊 Bar Plot":
+        return generate_plot(df, "product", "revenue", plot_type)
+    if plot_type == "📉 Histogram":
+        return histogram(df, "revenue", plot_type)
+    if plot_type == "🥧 Pie Chart":
+        return pie_plot(df, "region")
+    return heat_map(get_dummies(df))
+
+def bench_plots(sizes=DATA_SIZES, repeats=3):
+    results = {"benchmark": "plots", "sizes": []}
+    for rows in sizes:
+        df = loaded_frame(rows)
+        plots = {}
+        for plot_type in PLOT_TYPES:
+            timing = cold_warm(build_plot, df, plot_type, repeats=repeats)
+            # Payload is what the browser receives, which dominates rendering time for large frames
+            timing["payload_bytes"] = figure_size(build_plot(df, plot_type))
+            plots[plot_type] = timing
+        results["sizes"].append({"rows": rows, "plots": plots})
+    return results
+
+# ____________________________SQL ENGINE____________________________
+# DuckDB over the stored Parquet copy and over the raw CSV, against loading the Parquet into pandas and doing the same
+SQL_QUERIES = {
+    "group_by": ("SELECT region, product, SUM(revenue) AS revenue, AVG(margin) AS margin FROM data GROUP BY region, product",
+                 lambda df: df.groupby(["region", "product"], observed=True).agg(revenue=("revenue", "sum"), margin=("margin", "mean"))),
+    "filter_top": ("SELECT * FROM data WHERE units > 450 ORDER BY revenue DESC LIMIT 100",
+                   lambda df: df[df["units"] > 450].nlargest(100, "revenue")),
+}
+
+def bench_sql(sizes=DATA_SIZES, repeats=3):
+    results = {"benchmark": "sql_engine", "sizes": []}
+    for rows in sizes:
+        directory = tempfile.mkdtemp(prefix="bench_sql_")
+        try:
+            df = arrow_safe(loaded_frame(rows))
+            parquet_path = os.path.join(directory, "data.parquet")
+            csv_path = os.path.join(directory, "data.csv")
+            df.to_parquet(parquet_path, engine="pyarrow", index=False)
+            df.to_csv(csv_path, index=False)
+            del df
+            databases = {"duckdb_parquet": DatasetDatabase(parquet_path), "duckdb_csv": DatasetDatabase(csv_path)}
+            queries = {}
+            for name, (sql, pandas_query) in SQL_QUERIES.items():
+                queries[name] = {engine: cold_warm(database.execute, sql, repeats=repeats) for engine, database in databases.items()}
+                queries[name]["pandas_parquet"] = cold_warm(lambda: pandas_query(pd.read_parquet(parquet_path)), repeats=repeats)
+            for database in databases.values():
+                database.close()
+            results["sizes"].append({"rows": rows, "parquet_bytes": os.path.getsize(parquet_path),
+                                     "csv_bytes": os.path.getsize(csv_path), "queries": queries})
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+# ____________________________SUITE____________________________
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "provider": PROVIDER,
+    }
+
+def bench_suite(sizes=DATA_SIZES, pdf_path=None, repeats=3):
+    # Every benchmark at moderate settings, with enough context to compare runs across releases
+    benchmarks = [
+        bench_csv_load(sizes, repeats),
+        bench_analyze(sizes, repeats),
+        bench_dummies(sizes, repeats),
+        bench_plots(sizes, repeats),
+        bench_sql(sizes, repeats),
+        bench_outliers(wide_rows=10_000, wide_columns=200, tall_rows=max(sizes), tall_columns=4, repeats=repeats),
+        bench_retrieval(num_chunks=200, num_questions=20),
+        bench_qa(corpus_sizes=(200,), num_questions=10),
+        bench_context(pdf_paths=[pdf_path] if pdf_path else None, repeats=repeats),
+        bench_embedding(num_chunks=256, latency_seconds=0.05),
+    ]
+    if pdf_path:
+        benchmarks.append(bench_ingest(pdf_path))
+    return {"environment": environment(), "benchmarks": benchmarks}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the data assistant hot paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    retrieval = subparsers.add_parser("retrieval", help="Per-question overhead of llm_query excluding the model call")
+    retrieval.add_argument("--chunks", type=int, default=200)
+    retrieval.add_argument("--questions", type=int, default=50)
+    retrieval.add_argument("--threads", type=int, default=1)
+    embed = subparsers.add_parser("embed", help="Chunks/sec of the batched embedding pipeline")
+    embed.add_argument("--chunks", type=int, default=1000)
+    embed.add_argument("--batch-size", type=int, default=32)
+    embed.add_argument("--workers", type=int, default=4)
+    embed.add_argument("--texts-per-second", type=float, default=None)
+    embed.add_argument("--latency", type=float, default=0.2)
+    outliers = subparsers.add_parser("outliers", help="detect_outliers on wide and tall frames, old loop vs vectorized")
+    outliers.add_argument("--wide-rows", type=int, default=10_000)
+    outliers.add_argument("--wide-columns", type=int, default=500)
+    outliers.add_argument("--tall-rows", type=int, default=10_000_000)
+    outliers.add_argument("--tall-columns", type=int, default=4)
+    outliers.add_argument("--repeats", type=int, default=3)
+    qa = subparsers.add_parser("qa", help="RetrievalEngine query, cached query and streaming first token with a fake chat model")
+    qa.add_argument("--chunks", type=int, nargs="+", default=[200, 2000])
+    qa.add_argument("--questions", type=int, default=20)
+    qa.add_argument("--latency", type=float, default=0.5)
+    qa.add_argument("--token-latency", type=float, default=0.02)
+    context = subparsers.add_parser("context", help="Prompt tokens and answer latency, top-k vector vs hybrid retrieval")
+    context.add_argument("--pdf", nargs="+", help="Index these PDFs instead of the synthetic corpus")
+    context.add_argument("--chunks", type=int, default=200)
+    context.add_argument("--latency", type=float, default=0.3)
+    context.add_argument("--prompt-token-latency", type=float, default=0.0002)
+    context.add_argument("--repeats", type=int, default=3)
+    ingest = subparsers.add_parser("ingest", help="Cold and unchanged-file ingest of a PDF with fake embeddings")
+    ingest.add_argument("pdf")
+    ingest.add_argument("--latency", type=float, default=0.2)
+    for name, help_text in (("csv", "Upload parsing and schema inference"), ("analyze", "analyze_dataset exact vs approximate"),
+                            ("dummies", "Categorical encoding, uncached and cached"), ("plots", "Build time and payload of every plot type"),
+                            ("sql", "DuckDB over Parquet and CSV vs pandas for generated-SQL style queries")):
+        data = subparsers.add_parser(name, help=help_text)
+        data.add_argument("--sizes", type=int, nargs="+", default=DATA_SIZES)
+        data.add_argument("--repeats", type=int, default=3)
+    suite = subparsers.add_parser("suite", help="Everything above, tagged with commit and environment")
+    suite.add_argument("--sizes", type=int, nargs="+", default=DATA_SIZES)
+    suite.add_argument("--repeats", type=int, default=3)
+    suite.add_argument("--pdf", help="Also benchmark ingesting this PDF")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.command == "retrieval":
+        results = bench_retrieval(args.chunks, args.questions, args.threads)
+    elif args.command == "embed":
+        results = bench_embedding(args.chunks, args.batch_size, args.workers, args.texts_per_second, args.latency)
+    elif args.command == "outliers":
+        results = bench_outliers(args.wide_rows, args.wide_columns, args.tall_rows, args.tall_columns, args.repeats)
+    elif args.command == "qa":
+        results = bench_qa(args.chunks, args.questions, args.latency, args.token_latency)
+    elif args.command == "context":
+        results = bench_context(args.pdf, args.chunks, args.latency, args.prompt_token_latency, args.repeats)
+    elif args.command == "ingest":
+        results = bench_ingest(args.pdf, args.latency)
+    elif args.command == "csv":
+        results = bench_csv_load(args.sizes, args.repeats)
+    elif args.command == "analyze":
+        results = bench_analyze(args.sizes, args.repeats)
+    elif args.command == "dummies":
+        results = bench_dummies(args.sizes, args.repeats)
+    elif args.command == "plots":
+        results = bench_plots(args.sizes, args.repeats)
+    elif args.command == "sql":
+        results = bench_sql(args.sizes, args.repeats)
+    elif args.command == "suite":
+        results = bench_suite(args.sizes, args.pdf, args.repeats)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+    else:
+        print(json.dumps(results, indent=2, ensure_ascii=False, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+# ________________________________________________________CHART DATA REDUCTION____________________________________________
+# Frames up to MAX_POINTS rows go to plotly as-is; larger ones are reduced here so the browser only gets what it can draw
+MAX_POINTS = 4000
+MAX_BARS = 500
+HISTOGRAM_BINS = 30
+# Above this many plotted points line charts use Scattergl
+WEBGL_POINTS = 1000
+
+def is_continuous(series):
+    return pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+
+def as_float(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Milliseconds since the epoch, whatever the datetime resolution
+        return ((series - pd.Timestamp(0, tz=series.dt.tz)) / pd.Timedelta(milliseconds=1)).to_numpy(dtype="float64", na_value=np.nan)
+    return series.to_numpy(dtype="float64", na_value=np.nan)
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keeps the first and last point and, per bucket,
+    # the point forming the largest triangle with the previous pick and the next bucket's mean
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0] = 0
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        picked[i + 1] = previous
+    picked[-1] = n - 1
+    return picked
+
+def minmax_indices(y, buckets):
+    # Min and max of each bucket: preserves spikes that LTTB's averaging can smooth over
+    n = len(y)
+    if 2 * buckets >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    picked = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            window = y[start:end]
+            picked.extend((start + int(np.nanargmin(window)), start + int(np.nanargmax(window))))
+    return np.unique(picked)
+
+def downsample_line(df, x_column, y_column, max_points=MAX_POINTS, method="lttb"):
+    if len(df) <= max_points:
+        return df
+    data = df[[x_column, y_column]] if x_column != y_column else df[[x_column]]
+    data = data.dropna()
+    if is_continuous(data[x_column]):
+        data = data.sort_values(x_column, kind="stable")
+        x = as_float(data[x_column])
+    else:
+        # Categorical x is drawn in row order, so row position is the x axis
+        x = np.arange(len(data), dtype="float64")
+    if not pd.api.types.is_numeric_dtype(data[y_column]):
+        return data.iloc[np.linspace(0, len(data) - 1, max_points).astype(np.int64)]
+    y = as_float(data[y_column])
+    if method == "minmax":
+        picked = minmax_indices(y, max_points // 2)
+    else:
+        picked = lttb_indices(x, y, max_points)
+    return data.iloc[picked]
+
+def aggregate_bar(df, x_column, y_column, max_bars=MAX_BARS):
+    # px.bar stacks rows that share an x value, so their sum is what the chart shows anyway
+    if x_column == y_column:
+        # One column cannot hold both the category and its total; plot as-is
+        return df, False
+    if pd.api.types.is_numeric_dtype(df[y_column]):
+        bars = df.groupby(x_column, observed=True, sort=True)[y_column].sum().reset_index()
+    else:
+        bars = df[x_column].value_counts(sort=False).rename_axis(x_column).reset_index(name=y_column).sort_values(x_column)
+    truncated = len(bars) > max_bars
+    if truncated:
+        bars = bars.loc[bars[y_column].abs().nlargest(max_bars).index].sort_values(x_column)
+    return bars, truncated
+
+def histogram_bins(series, nbins=HISTOGRAM_BINS):
+    # Bin edges and counts computed with NumPy; only nbins rows are sent to the browser
+    values = series.dropna()
+    if not is_continuous(values):
+        counts = values.value_counts(sort=False)
+        return pd.DataFrame({"bin": counts.index.astype(str), "count": counts.to_numpy(), "width": None})
+    numbers = as_float(values)
+    numbers = numbers[np.isfinite(numbers)]
+    counts, edges = np.histogram(numbers, bins=nbins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Plotly measures date-axis bar widths in milliseconds, which is the unit as_float works in
+        centers = pd.to_datetime(centers, unit="ms")
+    return pd.DataFrame({"bin": centers, "count": counts, "width": widths})
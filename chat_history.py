@@ -0,0 +1,193 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from functools import lru_cache
+import pandas as pd
+from dataset_store import arrow_safe, store_available
+from sql_engine import QueryResult
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    # Only needed for SQL results, which DuckDB returns as Arrow and so never exist without pyarrow
+    pq = None
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are still serialised within the process by _log_lock
+    fcntl = None
+# ________________________________________________________CHAT HISTORY STORE____________________________________________
+# Session state keeps one small dict per turn; DataFrame and image answers are spilled to disk
+# and every turn is appended to a JSONL log as it happens, which is what a reopened session is rebuilt from
+HISTORY_PATH = "db/chat_history"
+EXPORT_PATH = "chat_history.txt"
+# Turns rendered per page of history; older ones are behind "load more"
+RENDER_TURNS = 10
+MAX_LOADED_RESULTS = 16
+# Retention: sessions untouched for HISTORY_TTL_SECONDS are deleted, and only the MAX_SESSIONS most recent are kept
+HISTORY_TTL_SECONDS = 7 * 24 * 60 * 60
+MAX_SESSIONS = 50
+# A duplicated tab or a shared link opens the same session in two ChatHistory objects, possibly in two processes
+_log_lock = threading.Lock()
+
+@lru_cache(maxsize=MAX_LOADED_RESULTS)
+def read_result(path):
+    # Shared between reruns for rendering only: callers must not mutate the frame
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+    with open(path, "rb") as f:
+        return f.read()
+
+@lru_cache(maxsize=MAX_LOADED_RESULTS)
+def read_table(path):
+    # SQL results are reopened as Arrow, memory-mapped, and converted to pandas a page at a time
+    return pq.read_table(path, memory_map=True)
+
+def json_value(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    # NumPy scalars and anything else pandasai returns are shown as text, which is how st.write renders them
+    return str(value)
+
+def valid_session_id(session_id):
+    # Session ids become directory names, so only the uuid4 hex form we hand out is accepted
+    return isinstance(session_id, str) and re.fullmatch(r"[0-9a-f]{32}", session_id) is not None
+
+def last_used(path):
+    try:
+        return os.path.getmtime(os.path.join(path, "turns.jsonl"))
+    except OSError:
+        return os.path.getmtime(path)
+
+def prune_sessions(root=HISTORY_PATH, ttl_seconds=HISTORY_TTL_SECONDS, max_sessions=MAX_SESSIONS, keep=()):
+    # Returns the number of session directories removed
+    try:
+        sessions = [(last_used(entry.path), entry) for entry in os.scandir(root) if entry.is_dir()]
+    except FileNotFoundError:
+        return 0
+    sessions.sort(key=lambda session: session[0], reverse=True)
+    now = time.time()
+    removed = 0
+    for rank, (used, entry) in enumerate(sessions):
+        if entry.name in keep:
+            continue
+        if rank >= max_sessions or now - used > ttl_seconds:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
+
+class ChatHistory:
+    def __init__(self, session_id=None, root=HISTORY_PATH):
+        self.session_id = session_id if valid_session_id(session_id) else uuid.uuid4().hex
+        self.path = os.path.join(root, self.session_id)
+        self.log_path = os.path.join(self.path, "turns.jsonl")
+        self.exported_path = os.path.join(self.path, "exported")
+        self.turns = self.read_log()
+        self.exported = self.read_exported()
+        self._lock = threading.Lock()
+
+    def read_log(self):
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def read_exported(self):
+        try:
+            with open(self.exported_path, "r", encoding="utf-8") as f:
+                return min(int(f.read().strip() or 0), len(self.turns))
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def spill(self, turn_id, response):
+        # Files are named after the turn's uuid, so two tabs on one session never write the same file
+        if isinstance(response, QueryResult):
+            os.makedirs(os.path.join(self.path, "results"), exist_ok=True)
+            path = os.path.join(self.path, "results", f"{turn_id}.parquet")
+            pq.write_table(response.table, path)
+            return {"kind": "sql_result", "ref": path, "sql": response.sql, "rows": response.num_rows,
+                    "truncated": response.truncated, "elapsed_seconds": response.elapsed_seconds}
+        if isinstance(response, pd.DataFrame):
+            os.makedirs(os.path.join(self.path, "results"), exist_ok=True)
+            if store_available():
+                path = os.path.join(self.path, "results", f"{turn_id}.parquet")
+                arrow_safe(response).to_parquet(path, engine="pyarrow")
+            else:
+                path = os.path.join(self.path, "results", f"{turn_id}.pkl")
+                response.to_pickle(path)
+            return {"kind": "dataframe", "ref": path, "rows": int(response.shape[0]), "columns": int(response.shape[1])}
+        if isinstance(response, (bytes, bytearray)):
+            os.makedirs(os.path.join(self.path, "results"), exist_ok=True)
+            path = os.path.join(self.path, "results", f"{turn_id}.png")
+            with open(path, "wb") as f:
+                f.write(response)
+            return {"kind": "image", "ref": path}
+        return {"kind": "text", "response": json_value(response)}
+
+    def append(self, input_text, response, sql_code=None, turn_id=None):
+        with self._lock:
+            turn = {"id": turn_id or uuid.uuid4().hex, "input": input_text, "sql_code": sql_code, "created": time.time()}
+            turn.update(self.spill(turn["id"], response))
+            os.makedirs(self.path, exist_ok=True)
+            with _log_lock, open(self.log_path, "a", encoding="utf-8") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                # One write per line while holding the lock, so concurrent appends never interleave
+                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+                f.flush()
+            # Picks up turns another tab on the same session has logged meanwhile
+            self.turns = self.read_log()
+        return turn
+
+    def load_response(self, turn):
+        if turn["kind"] == "text":
+            return turn["response"]
+        try:
+            if turn["kind"] == "sql_result":
+                return QueryResult(turn["sql"], read_table(turn["ref"]), turn["truncated"], turn["elapsed_seconds"])
+            return read_result(turn["ref"])
+        except (FileNotFoundError, OSError):
+            return f"(result no longer available: {turn['ref']})"
+
+    def recent(self, count=RENDER_TURNS):
+        return self.turns[-count:] if count else []
+
+    def export(self, path=EXPORT_PATH):
+        # Appends only the turns written since the last export instead of rewriting the whole file
+        with self._lock:
+            pending = self.turns[self.exported:]
+            with open(path, "a", encoding="utf-8") as file:
+                for turn in pending:
+                    if turn["kind"] == "sql_result":
+                        response = self.load_response(turn)
+                        response = response.page(0) if isinstance(response, QueryResult) else response
+                    elif turn["kind"] == "dataframe":
+                        response = self.load_response(turn)
+                    else:
+                        response = turn.get("response", turn.get("ref"))
+                    file.write(f"User: {turn['input']}\n")
+                    file.write(f"Assistant: {response}\n")
+                    if turn.get("sql_code"):
+                        file.write(f"SQL Code:\n{turn['sql_code']}\n")
+                    file.write("\n")
+            self.exported += len(pending)
+            if pending:
+                os.makedirs(self.path, exist_ok=True)
+                with open(self.exported_path, "w", encoding="utf-8") as f:
+                    f.write(str(self.exported))
+        return len(pending)
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.exported = 0
+            shutil.rmtree(self.path, ignore_errors=True)
@@ -1,150 +1,361 @@
 import streamlit as st
-import google.generativeai as genai
 from pandasai import SmartDataframe
-from pandasai.llm import GoogleGemini
 from pandasai.responses.response_parser import ResponseParser
 import pandas as pd
 from Visualization import *
 from langchain.prompts import PromptTemplate
-import time 
+from answer_cache import AnswerCache
+from figure_cache import FigureCache
+from chat_history import RENDER_TURNS, ChatHistory, prune_sessions
+from fingerprint import dataframe_fingerprint
+from providers import generative_model, pandasai_llm
+from sql_engine import PAGE_ROWS, QueryResult, run_sql, sql_prompt, table_schema
+from tracing import breakdown, current_span, in_current_context, record_usage, span
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 # Custom ResponseParser to handle output formatting
+# Values are returned rather than drawn here so that answers can be cached and replayed
 class OutputParser(ResponseParser):
     def __init__(self, context) -> None:
         super().__init__(context)
     def format_plot(self, result):
-        st.image(result["value"])
-        return
+        # pandasai reuses the same chart path, so keep the image bytes instead of the path
+        value = result["value"]
+        if isinstance(value, str) and os.path.exists(value):
+            with open(value, "rb") as f:
+                return f.read()
+        return value
     def format_dataframe(self, result):
-        st.dataframe(result["value"])
-        return
+        return result["value"]
     def format_response(self, result):
-        st.write(result["value"])
-        return
+        return result["value"]
+
+# Shared by every session: the same question on the same data gets the same answer
+csv_answer_cache = AnswerCache()
+# Larger SQL results are cached as their query only; see cached_answer
+MAX_CACHED_SQL_ROWS = PAGE_ROWS
+figure_cache = FigureCache()
+
+def render_response(result, key=None):
+    # key names the page selector of a SQL result; the turn id keeps the chosen page across reruns
+    if isinstance(result, QueryResult):
+        page = 0
+        if result.pages > 1:
+            page = st.number_input(f"Page (of {result.pages:,})", min_value=1, max_value=result.pages, value=1, key=key) - 1
+        # Only the page on screen is converted to pandas
+        st.dataframe(result.page(page))
+        st.caption(f"🦆 DuckDB: {result.summary()}")
+    elif isinstance(result, pd.DataFrame):
+        st.dataframe(result)
+    elif isinstance(result, bytes):
+        st.image(result)
+    else:
+        st.write(result)
 
 def initialize_gemini(api_key):
-    genai.configure(api_key=api_key)
-    # Initialize model with appropriate parameters
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
+    # Initialize model with appropriate parameters; LLM_PROVIDER=fake returns the offline stand-in
+    model = generative_model('gemini-2.0-flash-exp', api_key=api_key)
     return model
 
 def setup_chat_history():
     if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+        # The session id is kept in the URL, so reloading the page reopens the same history from its log.
+        # The id is the only key to it: anyone given the link can read the history, result tables included.
+        history = ChatHistory(st.query_params.get("chat"))
+        st.query_params["chat"] = history.session_id
+        prune_sessions(keep={history.session_id})
+        st.session_state.chat_history = history
+    if "visible_turns" not in st.session_state:
+        st.session_state.visible_turns = RENDER_TURNS
     if "previous_file" not in st.session_state:
         st.session_state.previous_file = None   
+    return st.session_state.chat_history
 
 def clear_chat_history():
-    st.session_state.chat_history = []
+    setup_chat_history().clear()
+    st.session_state.visible_turns = RENDER_TURNS
 
 def save_chat_history():
     try:
-        with open("chat_history.txt", "w") as file:
-            for chat in st.session_state.chat_history:
-                file.write(f"User: {chat['input']}\n")
-                file.write(f"Assistant: {chat['response']}\n")
-                if chat.get("sql_code"):
-                    file.write(f"SQL Code:\n{chat['sql_code']}\n")
-                file.write("\n")
+        setup_chat_history().export()
         return True
     except Exception as e:
         return str(e)
 
-def chat_with_csv(df, input_text, google_api_key, model):
-    try:
-        if model is None:
-            model = initialize_gemini(google_api_key)
-            
-        llm = GoogleGemini(api_key=google_api_key)
-        result = None
-        sql_code = None
-        
-        analysis_prompt = """
-        You are an advanced AI assistant named "Nexus" tasked with answering the user's query {question} based on the provided dataset's extracted {columns}. 
+def remember_trace(root):
+    # The timing panel shows the latest traced turn of this session
+    if getattr(root, "trace_id", None):
+        st.session_state.last_trace_id = root.trace_id
+
+def render_trace_panel():
+    if not st.sidebar.toggle("Show timing breakdown", value=False):
+        return
+    trace_id = st.session_state.get("last_trace_id")
+    if trace_id is None:
+        st.sidebar.caption("No traced turn yet")
+        return
+    st.sidebar.dataframe(pd.DataFrame(breakdown(trace_id)), hide_index=True, use_container_width=True)
+
+def render_chat_history(history):
+    # Only the latest turns are drawn on each rerun; earlier ones are loaded from disk on request
+    st.sidebar.caption("🔗 This page's link reopens this chat, including result tables. Share it only with people who may see them.")
+    hidden = len(history) - st.session_state.visible_turns
+    if hidden > 0 and st.button(f"Load {min(hidden, RENDER_TURNS)} earlier messages"):
+        st.session_state.visible_turns += RENDER_TURNS
+    for turn in history.recent(st.session_state.visible_turns):
+        with st.chat_message("user"):
+            st.write(turn["input"])
+        with st.chat_message("assistant"):
+            render_response(history.load_response(turn), key=f"page-{turn['id']}")
+            if turn.get("sql_code"):
+                with st.expander("Show SQL Code"):
+                    st.code(turn["sql_code"], language="sql")
+
+# The pandasai answer and the SQL are independent LLM calls, so they run side by side
+chat_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat")
+
+def completed_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+MAX_DATASET_SESSIONS = 2
+DATASET_DESCRIPTION = """
+        You are an advanced AI assistant named "Nexus" answering the user's queries based on the provided dataset's extracted {columns}. 
         You are capable of analyzing data from CSV/Excel files, reports, or databases and presenting the output in a DataFrame format.
         Use the following rules:
         - Always utilize all relevant context to generate a complete and accurate response.
         - Respond in the same language as the input question.
         - Identify and extract all mentioned columns in the user query and provide a DataFrame containing relevant data.
         - Ensure the final output is structured in a DataFrame format wherever applicable.
-        Input Details:
-        - columns: {columns}
-        - Question: {question}
         Response Format:
         - Answer: A clear response to the query.
         - DataFrame Output: Present the result of your analysis in a structured DataFrame format, including relevant columns and data.
 """
 
-        AI_prompt = PromptTemplate(input_variables=["question", "columns"], template=analysis_prompt)
-        
-        if df is not None:
-            AI_analysis = AI_prompt.format(question=input_text, columns=df.columns)
-            sdf = SmartDataframe(df, config={
-                "llm": llm,
-                "response_parser": OutputParser,
-                "prompt_template": AI_analysis
-            })            
-            result = sdf.chat(input_text)
-        else:   
-            # For non-dataframe queries, use the Gemini model directly
-            result = model.generate_content(input_text).text
-
-        # Generate SQL code for the question
-        sql_prompt = f"Generate the SQL code for the following question: '{input_text}'"
-        sql_code = model.generate_content(sql_prompt).text
-        
-        return result, sql_code
+class DatasetSession:
+    # Keeps one SmartDataframe, its LLM client and pandasai's code cache alive for every question on a dataset
+    def __init__(self, df, google_api_key):
+        self.fingerprint = dataframe_fingerprint(df)
+        self.llm = pandasai_llm(api_key=google_api_key)
+        description = PromptTemplate(input_variables=["columns"], template=DATASET_DESCRIPTION).format(columns=list(df.columns))
+        self.sdf = SmartDataframe(df, description=description, config={
+            "llm": self.llm,
+            "response_parser": OutputParser,
+            "enable_cache": True,
+        })
+        # SmartDataframe keeps per-conversation state, so questions on one dataset are answered one at a time
+        self.lock = threading.Lock()
+
+    def chat(self, question):
+        with self.lock:
+            return self.sdf.chat(question)
+
+def get_dataset_session(df, google_api_key):
+    # Must be called from the script thread: st.session_state is not available in the worker pool
+    fingerprint = dataframe_fingerprint(df)
+    sessions = st.session_state.setdefault("dataset_sessions", OrderedDict())
+    session = sessions.get(fingerprint)
+    if session is None:
+        session = DatasetSession(df, google_api_key)
+        sessions[fingerprint] = session
+    sessions.move_to_end(fingerprint)
+    while len(sessions) > MAX_DATASET_SESSIONS:
+        sessions.popitem(last=False)
+    return session
+
+def generate_answer(session, input_text, model):
+    if session is None:
+        # For non-dataframe queries, use the Gemini model directly
+        with span("llm.generate_answer") as current:
+            response = model.generate_content(input_text)
+            record_usage(current, input_text, response.text, getattr(response, "usage_metadata", None))
+            return response.text
+    # Code generation, execution and any retries all happen inside pandasai
+    with span("pandasai.chat"):
+        return session.chat(input_text)
+
+def generate_sql(model, input_text, on_token=None, schema=None):
+    # Generate SQL code for the question; with the table schema the query can be run as written
+    if schema is None:
+        prompt = f"Generate the SQL code for the following question: '{input_text}'"
+    else:
+        prompt = sql_prompt(input_text, schema)
+    with span("llm.generate_sql", stream=on_token is not None) as current:
+        if on_token is None:
+            response = model.generate_content(prompt)
+            record_usage(current, prompt, response.text, getattr(response, "usage_metadata", None))
+            return response.text
+        parts = []
+        usage = None
+        for chunk in model.generate_content(prompt, stream=True):
+            parts.append(chunk.text)
+            # The last streamed chunk carries the totals
+            usage = getattr(chunk, "usage_metadata", usage)
+            on_token(chunk.text)
+        record_usage(current, prompt, "".join(parts), usage)
+        return "".join(parts)
+
+def answer_with_sql(sql_future, fingerprint, df):
+    # The answer is the generated query's result, so it waits for the SQL instead of running beside it.
+    # It stays an Arrow table; render_response converts one page at a time.
+    return run_sql(fingerprint, sql_future.result(), df=df)
+
+def cached_answer(answer):
+    # SQL results beyond one page are not kept in the process-wide cache: a hit re-runs the cached SQL instead,
+    # which is cheap next to generating it
+    if isinstance(answer, QueryResult) and answer.num_rows > MAX_CACHED_SQL_ROWS:
+        return None
+    return answer
+
+def submit_chat_with_csv(df, input_text, google_api_key, model, on_sql_token=None, execute_sql=False, dataset_key=None):
+    # Returns (answer_future, sql_future); cached questions come back as already-completed futures.
+    # on_sql_token is called from the worker thread with each streamed SQL chunk.
+    # With execute_sql, the generated SQL is run in DuckDB and its result is the answer instead of pandasai's.
+    # dataset_key names a stored dataset that DuckDB reads from disk when no DataFrame was loaded.
+    fingerprint = dataset_key or (dataframe_fingerprint(df) if df is not None else None)
+    execute_sql = execute_sql and fingerprint is not None
+    cache_key = f"{fingerprint}-duckdb" if execute_sql else fingerprint
+    cached = csv_answer_cache.get(input_text, cache_key)
+    current_span().set(**{"cache.hit": cached is not None})
+    if cached is not None and cached[0] is None and execute_sql:
+        sql_future = completed_future(cached[1])
+        return chat_executor.submit(in_current_context(answer_with_sql), sql_future, fingerprint, df), sql_future
+    if cached is not None:
+        return completed_future(cached[0]), completed_future(cached[1])
+    if model is None:
+        model = initialize_gemini(google_api_key)
+    if execute_sql:
+        sql_future = chat_executor.submit(in_current_context(generate_sql), model, input_text, on_sql_token, table_schema(fingerprint, df))
+        answer_future = chat_executor.submit(in_current_context(answer_with_sql), sql_future, fingerprint, df)
+    else:
+        session = get_dataset_session(df, google_api_key) if df is not None else None
+        answer_future = chat_executor.submit(in_current_context(generate_answer), session, input_text, model)
+        sql_future = chat_executor.submit(in_current_context(generate_sql), model, input_text, on_sql_token)
+
+    def cache_when_done(_):
+        if not (answer_future.done() and sql_future.done()):
+            return
+        if answer_future.exception() is None and sql_future.exception() is None and answer_future.result() is not None:
+            csv_answer_cache.put(input_text, cache_key, (cached_answer(answer_future.result()), sql_future.result()))
+
+    answer_future.add_done_callback(cache_when_done)
+    sql_future.add_done_callback(cache_when_done)
+    return answer_future, sql_future
+
+def chat_with_csv(df, input_text, google_api_key, model):
+    try:
+        answer_future, sql_future = submit_chat_with_csv(df, input_text, google_api_key, model)
+        return answer_future.result(), sql_future.result()
     except Exception as e:
         raise Exception(f"Error in chat processing: {str(e)}")
 
-def handle_chat_interface(df, google_api_key, model):
+def timed_stream(tokens, timing):
+    # Records time-to-first-token and total time of a token stream into timing
+    start = time.perf_counter()
+    timing["ttft"] = None
+    for token in tokens:
+        if token and timing["ttft"] is None:
+            timing["ttft"] = time.perf_counter() - start
+        yield token
+    timing["total"] = time.perf_counter() - start
+
+def drain_tokens(tokens, future, poll_seconds=0.05):
+    # Yields queued tokens until the producing future is done; "" heartbeats let the caller poll other work
+    while True:
+        try:
+            yield tokens.get(timeout=poll_seconds)
+        except queue.Empty:
+            if future.done() and tokens.empty():
+                return
+            yield ""
+
+def render_streamed_turn(answer_future, sql_future, sql_tokens, key=None):
+    answer_slot = st.empty()
+    result = None
+    answer_rendered = False
+    timing = {}
+    with st.expander("Show SQL Code", expanded=True):
+        code_slot = st.empty()
+        sql_code = ""
+        for token in timed_stream(drain_tokens(sql_tokens, sql_future), timing):
+            if token:
+                sql_code += token
+                code_slot.code(sql_code, language="sql")
+            if not answer_rendered and answer_future.done():
+                result = answer_future.result()
+                with answer_slot.container():
+                    with st.chat_message("assistant"), span("chat.render"):
+                        render_response(result, key=key)
+                answer_rendered = True
+        sql_code = sql_future.result()
+        code_slot.code(sql_code, language="sql")
+    if not answer_rendered:
+        result = answer_future.result()
+        with answer_slot.container():
+            with st.chat_message("assistant"), span("chat.render"):
+                render_response(result, key=key)
+    if timing["ttft"] is not None:
+        st.caption(f"⏱️ First SQL token after {timing['ttft']:.2f}s, done in {timing['total']:.2f}s")
+    return result, sql_code
+
+def handle_chat_interface(df, google_api_key, model, stream=False, execute_sql=False, dataset_key=None):
     st.markdown("### Chat Interface")
-    setup_chat_history()
+    history = setup_chat_history()
 
     # Initialize model if not already done
     if model is None:
         model = initialize_gemini(google_api_key)
 
     # Display existing chat history
-    if "chat_history" in st.session_state:
-        for chat in st.session_state.chat_history:
-            with st.chat_message("user"):
-                st.write(chat["input"])
-            with st.chat_message("assistant"):
-                if isinstance(chat["response"], pd.DataFrame):
-                    st.dataframe(chat["response"])
-                else:
-                    st.write(chat["response"])
-                if chat.get("sql_code"):
-                    with st.expander("Show SQL Code"):
-                        st.code(chat["sql_code"], language="sql")
+    render_chat_history(history)
 
     # Input for new chat message
     if prompt := st.chat_input("Enter your question:"):
-        with st.spinner("Analysing..."):
-            time.sleep(1)
-            with st.chat_message("user"):
-                st.write(prompt)
-            try:
-                # Generate response
-                result, sql_code = chat_with_csv(df, prompt, google_api_key, model)
+        with st.chat_message("user"):
+            st.write(prompt)
+        # Known before rendering, so the answer's page selector keeps its key once the turn is redrawn from history
+        turn_id = uuid.uuid4().hex
+        try:
+            with span("chat.turn", stream=stream, execute_sql=execute_sql) as turn:
+                remember_trace(turn)
                 with st.spinner("Analysing..."):
-                    time.sleep(1)
-                    with st.chat_message("assistant"):
-                        if isinstance(result, pd.DataFrame):  
-                            st.dataframe(result)
-                        else:
-                            st.write(result)
-                with st.expander("Show SQL Code"):
-                    st.code(sql_code, language="sql")
+                    if stream:
+                        sql_tokens = queue.Queue()
+                        answer_future, sql_future = submit_chat_with_csv(df, prompt, google_api_key, model, on_sql_token=sql_tokens.put,
+                                                                           execute_sql=execute_sql, dataset_key=dataset_key)
+                        result, sql_code = render_streamed_turn(answer_future, sql_future, sql_tokens, key=f"page-{turn_id}")
+                    else:
+                        answer_future, sql_future = submit_chat_with_csv(df, prompt, google_api_key, model, execute_sql=execute_sql,
+                                                                           dataset_key=dataset_key)
+                        # Placeholders keep the answer above the SQL whichever finishes first
+                        answer_slot = st.empty()
+                        sql_slot = st.empty()
+                        for future in as_completed([answer_future, sql_future]):
+                            if future is answer_future:
+                                result = future.result()
+                                with answer_slot.container():
+                                    with st.chat_message("assistant"), span("chat.render"):
+                                        render_response(result, key=f"page-{turn_id}")
+                            else:
+                                sql_code = future.result()
+                                with sql_slot.container():
+                                    with st.expander("Show SQL Code"):
+                                        st.code(sql_code, language="sql")
 
-                # Save to chat history
-                st.session_state.chat_history.append({
-                    "input": prompt,
-                    "response": result,
-                    "sql_code": sql_code,
-                })
-            except Exception as e:
-                st.error(f"An error occurred: {str(e)}")
+                # Save to chat history; DataFrame and image answers go to disk
+                history.append(prompt, result, sql_code, turn_id=turn_id)
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+
+    cache_stats = csv_answer_cache.stats()
+    st.sidebar.caption(f"Answer cache: {cache_stats['entries']} entries, {cache_stats['hit_rate']:.0%} hit rate")
 
     if st.sidebar.button("Save Chat History"):
         save = save_chat_history()
@@ -153,6 +364,27 @@ def handle_chat_interface(df, google_api_key, model):
         else:
             st.sidebar.error(f"Error saving chat history: {save}")
             
+def build_figure(df, plot_type, x_column, y_column, top_n=None):
+    if plot_type in ["📈 Line Plot", "📊 Bar Plot"]:
+        return generate_plot(df, x_column, y_column, plot_type)
+    elif plot_type == "📉 Histogram":
+        return histogram(df, x_column, plot_type)
+    elif plot_type == "🥧 Pie Chart":
+        return pie_plot(df, x_column)
+    elif plot_type == "🌡️ Heatmap":
+        # get_dummies never modifies its input, so no defensive copy of the upload
+        heatmap = heat_map(get_dummies(df), top_n=top_n)
+        # Keep the PNG as bytes: a BytesIO is consumed by the first st.image
+        return heatmap.getvalue() if isinstance(heatmap, io.BytesIO) else heatmap
+
+def render_figure(figure):
+    if isinstance(figure, str):
+        st.error(figure)
+    elif isinstance(figure, go.Figure):
+        st.plotly_chart(figure, use_container_width=True)
+    else:
+        st.image(figure)
+
 def visualize_data(df):
     if df is not None:
 
@@ -169,39 +401,42 @@ def visualize_data(df):
             ]
         )
 
+        top_n = None
         if plot_type in ["🥧 Pie Chart", "📉 Histogram"]:
             x_column = st.sidebar.selectbox("Select column", all_columns)
             y_column = None
         elif plot_type == "🌡️ Heatmap":
             x_column = None
             y_column = None
+            top_n = int(st.sidebar.number_input("Most correlated columns", min_value=2, value=DEFAULT_HEATMAP_COLUMNS,
+                                                help="Wide datasets (especially after encoding) keep only the columns with the strongest correlations"))
         else:
             x_column = st.sidebar.selectbox("Select X-axis column", all_columns)
             y_column = st.sidebar.selectbox("Select Y-axis column", all_columns)
 
-        if st.sidebar.button("Generate Plot From The Dataset"):
-            with st.spinner("Generating Plot..."):
-                try:
-                    if plot_type in ["📈 Line Plot", "📊 Bar Plot"]:
-                        fig = generate_plot(df, x_column, y_column, plot_type)
-                        st.plotly_chart(fig, use_container_width=True)
-                    elif plot_type == "📉 Histogram":
-                        fig = histogram(df, x_column, plot_type)
-                        st.plotly_chart(fig, use_container_width=True)
-                    elif plot_type == "🥧 Pie Chart":
-                        fig = pie_plot(df, x_column)
-                        if isinstance(fig, str):
-                            st.error(fig)
-                        else:
-                            st.plotly_chart(fig, use_container_width=True)
-                    elif plot_type == "🌡️ Heatmap":
-                        df_numeric = get_dummies(df.copy())
-                        heatmap_buffer = heat_map(df_numeric)
-                        if isinstance(heatmap_buffer, str):
-                            st.error(heatmap_buffer)
-                        else:
-                            st.image(heatmap_buffer)
-                    st.success("Plot generated successfully!")
-
-                except Exception as e:
-                    st.error(f"Error generating plot: {e}")
+        # A chart that was generated before for this selection is shown straight away, and survives reruns
+        figure_key = (dataframe_fingerprint(df), plot_type, x_column, y_column, top_n)
+        generate = st.sidebar.button("Generate Plot From The Dataset")
+        if generate or figure_key in figure_cache:
+            # Reruns that only redraw a cached chart are not traced
+            with span("plot.turn", plot_type=plot_type) if generate else nullcontext() as turn:
+                remember_trace(turn)
+                # Only a Generate press counts towards the hit rate; other widget clicks just redraw the chart
+                figure = figure_cache.get(figure_key) if generate else figure_cache.peek(figure_key)
+                current_span().set(**{"cache.hit": figure is not None})
+                if figure is None and generate:
+                    with st.spinner("Generating Plot..."):
+                        try:
+                            figure = build_figure(df, plot_type, x_column, y_column, top_n)
+                            if not isinstance(figure, str):
+                                figure_cache.put(figure_key, figure)
+                                st.success("Plot generated successfully!")
+                        except Exception as e:
+                            st.error(f"Error generating plot: {e}")
+                if figure is not None:
+                    with span("plot.render") if generate else nullcontext():
+                        render_figure(figure)
+
+        figure_stats = figure_cache.stats()
+        st.sidebar.caption(f"Figure cache: {figure_stats['entries']} charts, {figure_stats['bytes'] / 2**20:.1f} MB, "
+                           f"{figure_stats['hit_rate']:.0%} hit rate")
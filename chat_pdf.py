@@ -2,44 +2,89 @@ from langchain_community.document_loaders import UnstructuredPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
-from uuid import uuid4
 from langchain.chains.question_answering import load_qa_chain
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
-from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
-from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
 from langchain.chains import RetrievalQA
 import warnings
 warnings.filterwarnings('ignore')
 import chromadb
+from embedding_pipeline import EmbeddingPipeline
+from answer_cache import AnswerCache
+from json_files import read_json, write_json
+from providers import PROVIDER, chat_model, embeddings
+from tracing import current_span, record_usage, span
+from document_registry import DEFAULT_TENANT, tenant_slug
+from hybrid_retrieval import RETRIEVAL_MODE, BM25Index, HybridRetriever
+import hashlib
+import json
 import os
+import threading
+from collections import OrderedDict
 # ___________________________Set environment variables_____________________________________
 os.environ["PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION"] = "python"
 from dotenv import load_dotenv
-import google.generativeai as genai
 load_dotenv()
 os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-# ________________________________________________________RAG WORKFLOW____________________________________________
+# Offline stand-in vectors must never end up next to real embeddings
+CHROMA_PATH = "db/chroma_store" if PROVIDER == "google" else f"db/chroma_store_{PROVIDER}"
+COLLECTION_NAME = "pdf_collection"
+EMBEDDING_MODEL = "models/embedding-001"
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 300
+# The manifest lives inside the store so that wiping the store also invalidates it
+MANIFEST_PATH = os.path.join(CHROMA_PATH, "ingest_manifest.json")
+# ________________________________________________________INGESTION MANIFEST____________________________________________
 
-def process_pdf(file):
-    loader = UnstructuredPDFLoader(file)
-    data = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=300)
-    chunks = text_splitter.split_documents(data)
-    # Create vectordb
-    embedding_function = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    vectorstore = Chroma(
-        client=chromadb.PersistentClient(path="db/chroma_store"),
-        collection_name="pdf_collection",
-        embedding_function=embedding_function,
-    )
-    documents = [Document(page_content=chunk.page_content, metadata=chunk.metadata) for chunk in chunks]
-    vectorstore.add_documents(documents=documents, ids=[str(uuid4()) for _ in documents])
-    return vectorstore  
+def file_hash(file):
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-def llm_query(vectorstore, question):
-        genllm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-exp", temperature=0)
-        prompt_template = """
+def ingest_config_key(metadata=None):
+    # Chunk metadata is part of the key: tagging a document with a doc_id/tenant re-indexes it under new ids
+    config = f"{CHUNK_SIZE}:{CHUNK_OVERLAP}:{EMBEDDING_MODEL}"
+    if metadata:
+        config += ":" + json.dumps(metadata, sort_keys=True)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()[:16]
+
+def chunk_ids(chunks, source, config_key):
+    # Same chunk text + same source + same config -> same id, so unchanged chunks are never re-embedded.
+    # Repeated identical chunks inside one document are told apart by their occurrence number.
+    ids = []
+    seen = {}
+    for chunk in chunks:
+        digest = hashlib.sha256(f"{source}\x00{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{config_key}-{digest}-{occurrence}")
+    return ids
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    return read_json(manifest_path, {})
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    write_json(manifest_path, manifest)
+
+def manifest_key(vectorstore, source, metadata=None):
+    # A registered document is tracked per collection and doc_id: the same file indexed for two tenants, or under two
+    # doc_ids, must not overwrite each other's entry and re-embed on every alternate ingest. Untagged ingests keep the source.
+    doc_id = (metadata or {}).get("doc_id")
+    if doc_id is None:
+        return source
+    return f"{vectorstore._collection.name}:{doc_id}:{source}"
+
+def is_up_to_date(entry, content_hash, config_key):
+    return bool(entry) and entry.get("file_hash") == content_hash and entry.get("config_key") == config_key
+# ________________________________________________________RAG WORKFLOW____________________________________________
+CHAT_MODEL = "gemini-2.0-flash-exp"
+RETRIEVER_K = 5
+# Document selections whose retriever and QA chain are kept built
+MAX_SCOPE_CHAINS = 32
+# Near-duplicate lookup costs one embedding call per cache miss, so it is opt-in
+SEMANTIC_ANSWER_CACHE = os.getenv("SEMANTIC_ANSWER_CACHE", "false").lower() == "true"
+PROMPT_TEMPLATE = """
         You are an advanced AI assistant whose name is "Nexus" tasked with answering user {question} based on the provided document's extracted {context}.You can also analyse data from CSV/Excel files reports, database.
         Use the following rules:
         - You can understand both Vietnamses and English 
@@ -54,10 +99,276 @@ def llm_query(vectorstore, question):
         {question}
         Response:
         """
-        human_message = HumanMessagePromptTemplate.from_template(template=prompt_template)
-        prompt = ChatPromptTemplate.from_messages([human_message])
-        retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 5})
-        qa_chain = load_qa_chain(genllm, chain_type="stuff", prompt=prompt, verbose=True)
-        retriever_qa = RetrievalQA(combine_documents_chain=qa_chain, retriever=retriever, verbose=True)
-        return retriever_qa.invoke(question)
 
+def build_prompt():
+    human_message = HumanMessagePromptTemplate.from_template(template=PROMPT_TEMPLATE)
+    return ChatPromptTemplate.from_messages([human_message])
+
+def tenant_collection(tenant, collection_name=COLLECTION_NAME):
+    # One collection per tenant keeps each tenant's search index, and therefore its search cost, separate
+    tenant = tenant_slug(tenant)
+    return collection_name if tenant == DEFAULT_TENANT else f"{collection_name}__{tenant}"
+
+def document_filter(tenant, doc_ids=None):
+    conditions = [{"tenant": tenant_slug(tenant)}]
+    if doc_ids is not None:
+        if not doc_ids:
+            raise ValueError("Select at least one document to search")
+        conditions.append({"doc_id": {"$in": sorted(doc_ids)}})
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+def build_qa_chain(llm, vectorstore, k=RETRIEVER_K):
+    prompt = build_prompt()
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
+    qa_chain = load_qa_chain(llm, chain_type="stuff", prompt=prompt, verbose=True)
+    return RetrievalQA(combine_documents_chain=qa_chain, retriever=retriever, verbose=True)
+
+class RetrievalEngine:
+    # Owns the Chroma client, embeddings, LLM client and QA chain so they are built once per process
+    def __init__(self, persist_path=CHROMA_PATH, collection_name=COLLECTION_NAME, llm=None, embedding_function=None, k=RETRIEVER_K,
+                 retrieval_mode=RETRIEVAL_MODE):
+        self.client = chromadb.PersistentClient(path=persist_path)
+        self.manifest_path = os.path.join(persist_path, os.path.basename(MANIFEST_PATH))
+        self.embedding_function = embedding_function or embeddings(EMBEDDING_MODEL)
+        self.collection_name = collection_name
+        self.k = k
+        self.retrieval_mode = retrieval_mode
+        self.vectorstore = Chroma(
+            client=self.client,
+            collection_name=collection_name,
+            embedding_function=self.embedding_function,
+        )
+        self.stores = {DEFAULT_TENANT: self.vectorstore}
+        self.llm = llm or chat_model(CHAT_MODEL, temperature=0)
+        self.qa_chain = build_qa_chain(self.llm, self.vectorstore, k=k)
+        self.retriever = self.qa_chain.retriever
+        self.prompt = build_prompt()
+        self.pipeline = EmbeddingPipeline(self.embedding_function)
+        self.answer_cache = AnswerCache(embedding_function=self.embedding_function if SEMANTIC_ANSWER_CACHE else None)
+        self.last_ingest_stats = None
+        self._corpus_fingerprint = None
+        self._ingest_lock = threading.Lock()
+        self._stores_lock = threading.Lock()
+        # tenant -> (corpus version, BM25Index)
+        self.keyword_indexes = {}
+        self._keyword_lock = threading.Lock()
+        # (mode, tenant, doc_ids) -> (keyword index, retriever, QA chain returning its source documents)
+        self.scope_chains = OrderedDict()
+        self._chains_lock = threading.Lock()
+
+    def store(self, tenant=DEFAULT_TENANT):
+        tenant = tenant_slug(tenant)
+        with self._stores_lock:
+            if tenant not in self.stores:
+                self.stores[tenant] = Chroma(
+                    client=self.client,
+                    collection_name=tenant_collection(tenant, self.collection_name),
+                    embedding_function=self.embedding_function,
+                )
+            return self.stores[tenant]
+
+    def keyword_index(self, tenant=DEFAULT_TENANT):
+        # Rebuilt from the collection's stored chunks whenever the corpus changes; no extra copy is kept on disk
+        tenant = tenant_slug(tenant)
+        store = self.store(tenant)
+        version = (self.corpus_fingerprint(), store._collection.count())
+        with self._keyword_lock:
+            cached = self.keyword_indexes.get(tenant)
+            if cached is None or cached[0] != version:
+                with span("rag.keyword_index", tenant=tenant) as index_span:
+                    data = store.get(include=["documents", "metadatas"])
+                    documents = [Document(page_content=text, metadata=metadata or {})
+                                 for text, metadata in zip(data["documents"], data["metadatas"])]
+                    cached = self.keyword_indexes[tenant] = (version, BM25Index(documents))
+                    index_span.set(chunks=len(documents))
+            return cached[1]
+
+    def ingest_document(self, entry):
+        # entry is a DocumentRegistry record; its chunks are tagged so queries can be limited to it
+        metadata = {"doc_id": entry["doc_id"], "tenant": entry["tenant"]}
+        with span("pdf.ingest", source=entry["source"], doc_id=entry["doc_id"], tenant=entry["tenant"]) as current, self._ingest_lock:
+            stats = ingest_pdf(self.store(entry["tenant"]), entry["source"], manifest_path=self.manifest_path,
+                               pipeline=self.pipeline, metadata=metadata)
+            current.set(up_to_date=stats is None)
+            if stats is not None:
+                current.set(chunks=stats["chunks"], embed_retries=stats["retries"])
+                self.last_ingest_stats = stats
+                self._corpus_fingerprint = None
+        return stats
+
+    def remove_document(self, entry):
+        with self._ingest_lock:
+            store = self.store(entry["tenant"])
+            store._collection.delete(where={"doc_id": entry["doc_id"]})
+            manifest = load_manifest(self.manifest_path)
+            key = manifest_key(store, os.path.normpath(entry["source"]), {"doc_id": entry["doc_id"]})
+            if manifest.pop(key, None) is not None:
+                save_manifest(manifest, self.manifest_path)
+            self._corpus_fingerprint = None
+
+    def ingest(self, file):
+        # Sessions asking about the same PDF at once must not both re-embed it
+        with span("pdf.ingest", source=str(file)) as current, self._ingest_lock:
+            stats = ingest_pdf(self.vectorstore, file, manifest_path=self.manifest_path, pipeline=self.pipeline)
+            current.set(up_to_date=stats is None)
+            if stats is not None:
+                current.set(chunks=stats["chunks"], embed_retries=stats["retries"])
+                self.last_ingest_stats = stats
+                self._corpus_fingerprint = None
+        return self.vectorstore
+
+    def corpus_fingerprint(self):
+        # Changes whenever any ingested document or the ingest config changes, which retires cached answers
+        if self._corpus_fingerprint is None:
+            manifest = load_manifest(self.manifest_path)
+            entries = sorted((source, entry.get("file_hash"), entry.get("config_key")) for source, entry in manifest.items())
+            self._corpus_fingerprint = hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()[:32]
+        return self._corpus_fingerprint
+
+    def scope_fingerprint(self, tenant=DEFAULT_TENANT, doc_ids=None):
+        # Answers are only reused for the same corpus state and the same document selection
+        if tenant_slug(tenant) == DEFAULT_TENANT and doc_ids is None:
+            return self.corpus_fingerprint()
+        scope = [self.corpus_fingerprint(), tenant_slug(tenant), sorted(doc_ids) if doc_ids is not None else None]
+        return hashlib.sha256(json.dumps(scope).encode("utf-8")).hexdigest()[:32]
+
+    def build_retriever(self, tenant, doc_ids, keyword_index):
+        unfiltered = tenant_slug(tenant) == DEFAULT_TENANT and doc_ids is None
+        if keyword_index is not None:
+            return HybridRetriever(vectorstore=self.store(tenant), keyword_index=keyword_index,
+                                   where=None if unfiltered else document_filter(tenant, doc_ids), doc_ids=doc_ids, max_chunks=self.k)
+        if unfiltered:
+            return self.retriever
+        # Filtered at search time, inside the tenant's own collection
+        return self.store(tenant).as_retriever(search_type="similarity", search_kwargs={"k": self.k, "filter": document_filter(tenant, doc_ids)})
+
+    def scope_chain(self, tenant=DEFAULT_TENANT, doc_ids=None):
+        # Built once per document selection, and again only when the tenant's keyword index is rebuilt.
+        # Same "stuff" chain and prompt as qa_chain; the retrieved chunks come back for token accounting.
+        keyword_index = self.keyword_index(tenant) if self.retrieval_mode == "hybrid" else None
+        scope = (self.retrieval_mode, tenant_slug(tenant), tuple(sorted(doc_ids)) if doc_ids is not None else None)
+        with self._chains_lock:
+            cached = self.scope_chains.get(scope)
+            if cached is None or cached[0] is not keyword_index:
+                retriever = self.build_retriever(tenant, doc_ids, keyword_index)
+                qa_chain = RetrievalQA(combine_documents_chain=self.qa_chain.combine_documents_chain, retriever=retriever,
+                                       return_source_documents=True)
+                cached = self.scope_chains[scope] = (keyword_index, retriever, qa_chain)
+            self.scope_chains.move_to_end(scope)
+            while len(self.scope_chains) > MAX_SCOPE_CHAINS:
+                self.scope_chains.popitem(last=False)
+        return cached
+
+    def retriever_for(self, tenant=DEFAULT_TENANT, doc_ids=None):
+        return self.scope_chain(tenant, doc_ids)[1]
+
+    def query(self, question, tenant=DEFAULT_TENANT, doc_ids=None):
+        with span("rag.query", tenant=tenant_slug(tenant), documents=len(doc_ids) if doc_ids is not None else "all") as current:
+            fingerprint = self.scope_fingerprint(tenant, doc_ids)
+            cached = self.answer_cache.get(question, fingerprint)
+            current.set(**{"cache.hit": cached is not None})
+            if cached is not None:
+                return dict(cached, cached=True)
+            # Retrieval and generation happen inside the chain; stream() times them separately
+            qa_chain = self.scope_chain(tenant, doc_ids)[2]
+            with span("rag.qa_chain") as chain_span:
+                answer = qa_chain.invoke(question)
+                documents = answer.pop("source_documents", [])
+                record_usage(chain_span, self.format_prompt(documents, question)[-1].content, answer.get("result", ""))
+            self.answer_cache.put(question, fingerprint, answer)
+            return answer
+
+    def format_prompt(self, documents, question):
+        # The messages the "stuff" chain sends: chunks joined with blank lines into the prompt's context
+        context = "\n\n".join(doc.page_content for doc in documents)
+        return self.prompt.format_messages(context=context, question=question)
+
+    def stream(self, question, tenant=DEFAULT_TENANT, doc_ids=None):
+        # Same retrieval and "stuff" prompt as query(), but yields the answer text as the model produces it
+        fingerprint = self.scope_fingerprint(tenant, doc_ids)
+        cached = self.answer_cache.get(question, fingerprint)
+        if cached is not None:
+            current_span().set(**{"cache.hit": True})
+            yield cached.get("result", "")
+            return
+        with span("rag.retrieve") as retrieve_span:
+            documents = self.retriever_for(tenant, doc_ids).invoke(question)
+            retrieve_span.set(documents=len(documents))
+        messages = self.format_prompt(documents, question)
+        parts = []
+        # Covers the time the consumer spends rendering between tokens too, which is what the user waits for
+        with span("rag.generate", **{"cache.hit": False}) as generate_span:
+            for chunk in self.llm.stream(messages):
+                parts.append(chunk.content)
+                yield chunk.content
+            record_usage(generate_span, messages[-1].content, "".join(parts))
+        self.answer_cache.put(question, fingerprint, {"query": question, "result": "".join(parts)})
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_retrieval_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+def ingest_pdf(vectorstore, file, manifest_path=MANIFEST_PATH, pipeline=None, metadata=None):
+    # Returns the embedding stats, or None when the document was already up to date.
+    # metadata (e.g. doc_id and tenant) is added to every chunk for filtering at query time.
+    source = os.path.normpath(file)
+    # Unchanged document: serve straight from the existing store
+    manifest = load_manifest(manifest_path)
+    content_hash = file_hash(source)
+    config_key = ingest_config_key(metadata)
+    key = manifest_key(vectorstore, source, metadata)
+    if is_up_to_date(manifest.get(key), content_hash, config_key):
+        return None
+
+    with span("pdf.parse"):
+        loader = UnstructuredPDFLoader(source)
+        data = loader.load()
+    with span("pdf.split") as split_span:
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        chunks = text_splitter.split_documents(data)
+        split_span.set(chunks=len(chunks))
+    ids = chunk_ids(chunks, source, config_key)
+    # Everything stored for this source, including uuid4 duplicates left by older versions. Chunks tagged with another
+    # doc_id belong to another registry entry for the same file and are left to that entry.
+    doc_id = (metadata or {}).get("doc_id")
+    stored = vectorstore.get(where={"source": source}, include=["metadatas"])
+    existing = set(stored["ids"])
+    wanted = set(ids)
+    stale = [chunk_id for chunk_id, chunk_metadata in zip(stored["ids"], stored["metadatas"])
+             if chunk_id not in wanted and (chunk_metadata or {}).get("doc_id") in (None, doc_id)]
+    if stale:
+        vectorstore.delete(ids=stale)
+    documents = [Document(page_content=chunk.page_content, metadata={**chunk.metadata, **(metadata or {})}) for chunk in chunks]
+    new_documents = [(doc, chunk_id) for doc, chunk_id in zip(documents, ids) if chunk_id not in existing]
+    pipeline = pipeline or EmbeddingPipeline(vectorstore.embeddings)
+    # A failed batch raises before the manifest is saved; batches already written keep their ids and are skipped next time
+    with span("pdf.embed", chunks=len(new_documents)):
+        stats = pipeline.run([doc for doc, _ in new_documents], [chunk_id for _, chunk_id in new_documents], vectorstore=vectorstore)
+    manifest[key] = {
+        "file_hash": content_hash,
+        "config_key": config_key,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_ids": ids,
+    }
+    save_manifest(manifest, manifest_path)
+    return stats
+
+def process_pdf(file):
+    return get_retrieval_engine().ingest(file)
+
+def llm_query(vectorstore, question):
+    engine = get_retrieval_engine()
+    if vectorstore is engine.vectorstore:
+        return engine.query(question)
+    # Foreign vectorstore: no shared chain to reuse
+    genllm = chat_model(CHAT_MODEL, temperature=0)
+    return build_qa_chain(genllm, vectorstore).invoke(question)
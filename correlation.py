@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from fingerprint import dataframe_fingerprint
+# ________________________________________________________CORRELATION ENGINE____________________________________________
+# Matrices are computed once per dataset fingerprint; heatmap reruns and top-N changes only slice the cached result
+MAX_CACHED_MATRICES = 4
+_matrices = OrderedDict()
+_matrices_lock = threading.Lock()
+
+def correlation_columns(df):
+    # Same columns df.corr() accepts, with get_dummies' boolean indicators counted as 0/1
+    return list(df.select_dtypes(include=["number", "bool"]).columns)
+
+def pearson_matrix(values):
+    # Pairwise-complete Pearson correlation (what df.corr() computes) as a handful of matrix products
+    # instead of one pass over the rows per column pair
+    present = ~np.isnan(values)
+    if present.all():
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.corrcoef(values, rowvar=False)
+    # Centre first so the sums of squares below do not cancel catastrophically
+    centred = values - np.nanmean(values, axis=0)
+    filled = np.where(present, centred, 0.0)
+    mask = present.astype(np.float64)
+    pairs = mask.T @ mask
+    sums = filled.T @ mask
+    squares = (filled ** 2).T @ mask
+    products = filled.T @ filled
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = products - sums * sums.T / pairs
+        variance = squares - sums ** 2 / pairs
+        corr = covariance / np.sqrt(variance * variance.T)
+    corr[pairs < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+def correlation_matrix(df):
+    key = dataframe_fingerprint(df)
+    with _matrices_lock:
+        if key in _matrices:
+            _matrices.move_to_end(key)
+            return _matrices[key]
+    columns = correlation_columns(df)
+    values = df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    corr = pd.DataFrame(pearson_matrix(values), index=columns, columns=columns)
+    with _matrices_lock:
+        _matrices[key] = corr
+        while len(_matrices) > MAX_CACHED_MATRICES:
+            _matrices.popitem(last=False)
+    return corr
+
+def top_correlated(corr, n):
+    # Keep the n columns with the strongest correlation to any other column, in their original order
+    if n is None or n >= len(corr):
+        return corr
+    strength = corr.abs().mask(np.eye(len(corr), dtype=bool))
+    strongest = set(strength.max(axis=1).fillna(0).nlargest(n).index)
+    keep = [col for col in corr.index if col in strongest]
+    return corr.loc[keep, keep]
@@ -1,23 +1,50 @@
 import pandas as pd
 import datetime as dt
 import numpy as np
-def detect_outliers(df):
-    numerical_cols = df.select_dtypes(include=['float64', 'int64']).columns
-    outliers_summary = {}
-    
-    for col in numerical_cols:
-        Q1 = df[col].quantile(0.25)
-        Q3 = df[col].quantile(0.75)
-        IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
-        outliers_count = outliers.shape[0]
-        if outliers_count > 0:
-            outliers_summary[col] = outliers_count
-        else:
-            outliers_summary[col] = 0
+from schema_inference import apply_schema, infer_schema
+from tracing import traced
+OUTLIER_METHODS = ("iqr", "zscore", "mad")
+IQR_FACTOR = 1.5
+ZSCORE_THRESHOLD = 3.0
+# Iglewicz-Hoaglin modified z-score cut-off; 0.6745 makes the MAD comparable to a standard deviation
+MAD_THRESHOLD = 3.5
+MAD_SCALE = 0.6745
+# sigma ≈ 1.2533 × mean absolute deviation; stands in for the MAD when over half the values are identical (MAD = 0)
+MEAN_AD_SCALE = 1.253314
+
+def numeric_columns(df):
+    # "number" covers float32/int32 and the nullable Int64/Float64 dtypes, not just float64/int64. It also matches
+    # timedelta64, which has no float quartiles, so durations are left out as they were before.
+    return df.select_dtypes(include="number", exclude="timedelta").columns
+
+def outlier_bounds(numeric, method="iqr"):
+    # Per-column (lower, upper) Series computed in one pass over the frame
+    if method == "iqr":
+        quartiles = numeric.quantile([0.25, 0.75])
+        q1, q3 = quartiles.loc[0.25], quartiles.loc[0.75]
+        iqr = q3 - q1
+        return q1 - IQR_FACTOR * iqr, q3 + IQR_FACTOR * iqr
+    elif method == "zscore":
+        mean, std = numeric.mean(), numeric.std()
+        return mean - ZSCORE_THRESHOLD * std, mean + ZSCORE_THRESHOLD * std
+    elif method == "mad":
+        median = numeric.median()
+        deviations = (numeric - median).abs()
+        mad = deviations.median()
+        spread = (MAD_THRESHOLD * mad / MAD_SCALE).where(mad > 0, MAD_THRESHOLD * MEAN_AD_SCALE * deviations.mean())
+        return median - spread, median + spread
+    raise ValueError(f"Unknown outlier method: {method}. Choose one of {OUTLIER_METHODS}")
+
+def count_outliers(df, method="iqr"):
+    numeric = df[numeric_columns(df)]
+    if numeric.shape[1] == 0:
+        return pd.Series(dtype="int64")
+    lower, upper = outlier_bounds(numeric, method)
+    # Bounds broadcast across columns; summing the boolean mask counts rows without copying any of them
+    return ((numeric < lower) | (numeric > upper)).sum().astype("int64")
+
+def detect_outliers(df, method="iqr"):
+    outliers_summary = count_outliers(df, method)
     
     if len(outliers_summary) > 0:
         outliers_info = "\n".join([f"{col}: {count} outliers" for col, count in outliers_summary.items()])
@@ -25,35 +52,16 @@ def detect_outliers(df):
         outliers_info = "No outliers detected."
     
     return outliers_info
-def analyze_dataset(df):
+@traced("data.analyze_dataset")
+def analyze_dataset(df, outlier_method="iqr", mode="exact"):
+    # mode: "exact", "approximate" (sampled, with error bounds) or "auto"; see profiling.profile_dataset
+    from profiling import profile_dataset
     if not isinstance(df, pd.DataFrame):
         return "Input is not a valid DataFrame."
-    
-    # 1. Number of rows and columns
-    num_rows, num_columns = df.shape
-    dataset_info = f"Dataset Info:\n- Number of rows: {num_rows} : - Number of columns: {num_columns}\n\n"
-    
-    # 2. Data types of each column
-    data_types = df.dtypes
-    dataset_info += "Data Types of Columns:\n" + data_types.apply(lambda x: f": {x}").to_string() + "\n\n"
-    
-    # 3. Null Values
-    null_values = df.isnull().sum()
-    dataset_info += "Null Values per Column:\n" + null_values.apply(lambda x: f": {x}").to_string() + "\n\n"
-    
-    # 4. Detecting Outliers
-    outliers_info = detect_outliers(df)
-    dataset_info += f"\nOutliers Summary:\n{outliers_info}"
-    
-    return dataset_info
+    return profile_dataset(df, mode=mode, outlier_method=outlier_method).to_text()
 
-def convert_dates(df):
-    date_columns = []
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            sample = df[col].dropna().iloc[0] if not df[col].dropna().empty else ''
-            if isinstance(sample, str) and any(char in sample for char in ['-', '/', '.', ':']):
-                date_columns.append(col)
-    for col in date_columns:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    return df
+def convert_dates(df, schema=None):
+    # Parses with a format inferred once from a sample instead of guessing per element; pass a cached schema to skip inference
+    if schema is None:
+        schema = infer_schema(df, kinds=("datetime",))
+    return apply_schema(df, schema)
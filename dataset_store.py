@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import Counter
+import pandas as pd
+from fingerprint import register_fingerprint
+from json_files import read_json, write_json
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+# ________________________________________________________COLUMNAR DATASET STORE____________________________________________
+# Parsed uploads are kept as Parquet keyed by the upload's content hash, so reopening one skips CSV/Excel parsing
+STORE_PATH = "db/datasets"
+INDEX_PATH = os.path.join(STORE_PATH, "index.json")
+MAX_DATASETS = 20
+# Bumped when stored files change shape; older entries are re-parsed instead of served.
+# 2: integer columns are no longer narrowed to int8/int16/int32
+STORE_FORMAT = 2
+_index_lock = threading.Lock()
+# Datasets a DuckDB view is reading; eviction leaves their files alone until the view is closed
+_pinned = Counter()
+
+def store_available():
+    return pq is not None
+
+def dataset_path(key):
+    return os.path.join(STORE_PATH, f"{key}.parquet")
+
+def load_index():
+    return read_json(INDEX_PATH, {})
+
+def save_index(index):
+    write_json(INDEX_PATH, index)
+
+def schema_path(key):
+    return os.path.join(STORE_PATH, f"{key}.schema.json")
+
+def load_schema(key):
+    # Inferred schemas are kept even without pyarrow, so re-parsing an upload skips inference
+    return read_json(schema_path(key))
+
+def save_schema(key, schema):
+    write_json(schema_path(key), schema)
+
+def upload_path(key):
+    return os.path.join(STORE_PATH, f"{key}.csv")
+
+def has_upload(key):
+    return os.path.exists(upload_path(key))
+
+def pin(key):
+    with _index_lock:
+        _pinned[key] += 1
+
+def unpin(key):
+    with _index_lock:
+        _pinned[key] -= 1
+        if _pinned[key] <= 0:
+            del _pinned[key]
+
+def has_dataset(key):
+    return store_available() and load_index().get(key, {}).get("format") == STORE_FORMAT and os.path.exists(dataset_path(key))
+
+def arrow_safe(df):
+    # Parquet needs string column names, and object columns mixing types (numbers and text) are not one Arrow type
+    mixed = [col for col in df.select_dtypes(include="object").columns
+             if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed")]
+    if not mixed and all(isinstance(col, str) for col in df.columns):
+        return df
+    df = df.copy(deep=False)
+    for col in mixed:
+        df[col] = df[col].astype("string")
+    df.columns = [str(col) for col in df.columns]
+    return df
+
+def save_dataset(key, name, df):
+    if not store_available():
+        return False
+    os.makedirs(STORE_PATH, exist_ok=True)
+    tmp_path = dataset_path(key) + ".tmp"
+    df = arrow_safe(df)
+    df.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, dataset_path(key))
+    now = time.time()
+    with _index_lock:
+        index = load_index()
+        index[key] = {
+            "format": STORE_FORMAT,
+            "name": name,
+            "rows": int(df.shape[0]),
+            "columns": int(df.shape[1]),
+            "dtypes": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+            "size_bytes": os.path.getsize(dataset_path(key)),
+            "created": now,
+            "last_opened": now,
+        }
+        evict(index)
+        save_index(index)
+    return True
+
+def save_upload(key, name, data):
+    # The raw CSV for SQL mode, which DuckDB scans in place; it needs neither pandas nor pyarrow.
+    # The index entry only schedules it for eviction: without a Parquet copy it is not listed as a recent dataset.
+    os.makedirs(STORE_PATH, exist_ok=True)
+    tmp_path = upload_path(key) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, upload_path(key))
+    now = time.time()
+    with _index_lock:
+        index = load_index()
+        index.setdefault(key, {"name": name, "created": now})["last_opened"] = now
+        evict(index)
+        save_index(index)
+
+def open_dataset(key):
+    # Memory-mapped read: the OS pages the column chunks in instead of copying the file through Python
+    table = pq.read_table(dataset_path(key), memory_map=True)
+    df = table.to_pandas(split_blocks=True)
+    with _index_lock:
+        index = load_index()
+        if key in index:
+            index[key]["last_opened"] = time.time()
+            save_index(index)
+    return register_fingerprint(df, key)
+
+def recent_datasets(limit=10):
+    if not store_available():
+        return []
+    index = load_index()
+    entries = [dict(entry, key=key) for key, entry in index.items()
+               if entry.get("format") == STORE_FORMAT and os.path.exists(dataset_path(key))]
+    return sorted(entries, key=lambda entry: entry["last_opened"], reverse=True)[:limit]
+
+def evict(index):
+    # Called with _index_lock held. Pinned entries are skipped and go on a later save once their view is closed.
+    unpinned = [key for key in sorted(index, key=lambda k: index[k]["last_opened"]) if key not in _pinned]
+    for key in unpinned[:max(0, len(index) - MAX_DATASETS)]:
+        del index[key]
+        for path in (dataset_path(key), schema_path(key), upload_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,94 @@
+import os
+import re
+import threading
+import time
+from json_files import read_json, write_json
+# ________________________________________________________DOCUMENT REGISTRY____________________________________________
+# Which PDFs each tenant has, where their bytes live and whether they are indexed.
+# Documents are identified by content hash, so uploading the same file twice indexes it once.
+DOCUMENTS_PATH = "db/documents"
+REGISTRY_PATH = os.path.join(DOCUMENTS_PATH, "registry.json")
+DEFAULT_TENANT = "default"
+_registry_lock = threading.Lock()
+
+def tenant_slug(tenant):
+    # Safe for directory and Chroma collection names
+    slug = re.sub(r"[^a-zA-Z0-9_-]+", "-", str(tenant).strip()).strip("-_").lower()
+    return slug[:40] or DEFAULT_TENANT
+
+def load_registry(path=REGISTRY_PATH):
+    return read_json(path, {})
+
+def save_registry(registry, path=REGISTRY_PATH):
+    write_json(path, registry)
+
+class DocumentRegistry:
+    def __init__(self, path=REGISTRY_PATH, documents_path=DOCUMENTS_PATH):
+        self.path = path
+        self.documents_path = documents_path
+
+    def register(self, tenant, doc_id, name, source):
+        tenant = tenant_slug(tenant)
+        with _registry_lock:
+            registry = load_registry(self.path)
+            documents = registry.setdefault(tenant, {})
+            entry = documents.get(doc_id)
+            if entry is None:
+                entry = documents[doc_id] = {"doc_id": doc_id, "tenant": tenant, "name": name, "source": source,
+                                             "created": time.time(), "indexed": False}
+                save_registry(registry, self.path)
+        return dict(entry)
+
+    def add_upload(self, tenant, doc_id, name, data):
+        # Uploaded bytes are kept so the document can be re-indexed after a config change without asking for it again
+        tenant = tenant_slug(tenant)
+        source = os.path.join(self.documents_path, tenant, f"{doc_id}.pdf")
+        if not os.path.exists(source):
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            tmp_path = source + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, source)
+        return self.register(tenant, doc_id, name, source)
+
+    def add_file(self, tenant, doc_id, path, name=None):
+        # Files already on disk (like the bundled AI.pdf) are indexed in place. Editing one gives it a new doc_id, so the
+        # entries for its earlier content are dropped and returned with the new entry for the caller to un-index.
+        tenant = tenant_slug(tenant)
+        source = os.path.normpath(path)
+        with _registry_lock:
+            registry = load_registry(self.path)
+            documents = registry.get(tenant, {})
+            replaced = [documents.pop(old_id) for old_id, entry in list(documents.items())
+                        if entry["source"] == source and old_id != doc_id]
+            if replaced:
+                save_registry(registry, self.path)
+        return self.register(tenant, doc_id, name or os.path.basename(path), source), replaced
+
+    def documents(self, tenant):
+        registry = load_registry(self.path)
+        return sorted(registry.get(tenant_slug(tenant), {}).values(), key=lambda entry: entry["name"].lower())
+
+    def get(self, tenant, doc_id):
+        return load_registry(self.path).get(tenant_slug(tenant), {}).get(doc_id)
+
+    def mark_indexed(self, tenant, doc_id):
+        with _registry_lock:
+            registry = load_registry(self.path)
+            entry = registry.get(tenant_slug(tenant), {}).get(doc_id)
+            if entry is not None and not entry["indexed"]:
+                entry["indexed"] = True
+                save_registry(registry, self.path)
+
+    def remove(self, tenant, doc_id):
+        with _registry_lock:
+            registry = load_registry(self.path)
+            entry = registry.get(tenant_slug(tenant), {}).pop(doc_id, None)
+            if entry is not None:
+                save_registry(registry, self.path)
+        if entry is not None and entry["source"].startswith(os.path.join(self.documents_path, "")):
+            try:
+                os.remove(entry["source"])
+            except FileNotFoundError:
+                pass
+        return entry
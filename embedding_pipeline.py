@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_community.vectorstores.utils import filter_complex_metadata
+# ________________________________________________________EMBEDDING PIPELINE____________________________________________
+# Defaults sized for the free Gemini embedding quota; every text in a batch counts against it
+BATCH_SIZE = 32
+MAX_WORKERS = 4
+TEXTS_PER_SECOND = 25
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # A single request larger than the bucket would otherwise wait forever
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+class EmbeddingPipeline:
+    # embedding_function is anything with embed_documents(list_of_texts), e.g. GoogleGenerativeAIEmbeddings
+    # or langchain_core's DeterministicFakeEmbedding for offline runs
+    def __init__(self, embedding_function, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS, texts_per_second=TEXTS_PER_SECOND,
+                 max_retries=MAX_RETRIES, backoff_seconds=BACKOFF_SECONDS):
+        self.embedding_function = embedding_function
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(texts_per_second, capacity=max(texts_per_second, batch_size)) if texts_per_second else None
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self._retries = 0
+        self._retries_lock = threading.Lock()
+
+    def batches(self, documents, ids):
+        for start in range(0, len(documents), self.batch_size):
+            yield documents[start:start + self.batch_size], ids[start:start + self.batch_size]
+
+    def embed_batch(self, texts):
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire(len(texts))
+            try:
+                return self.embedding_function.embed_documents(texts)
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                with self._retries_lock:
+                    self._retries += 1
+                # Exponential backoff with jitter so the workers do not retry in lockstep
+                delay = min(MAX_BACKOFF_SECONDS, self.backoff_seconds * (2 ** attempt))
+                time.sleep(delay * (0.5 + random.random() / 2))
+                attempt += 1
+
+    def run(self, documents, ids, vectorstore=None, on_batch=None):
+        # Batches are written from this thread as they finish, so the Chroma client is never shared across workers
+        start = time.perf_counter()
+        self._retries = 0
+        documents = filter_complex_metadata(list(documents))
+        written = 0
+        num_batches = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {
+                pool.submit(self.embed_batch, [doc.page_content for doc in batch]): (batch, batch_ids)
+                for batch, batch_ids in self.batches(documents, ids)
+            }
+            for future in as_completed(futures):
+                batch, batch_ids = futures[future]
+                embeddings = future.result()
+                if vectorstore is not None:
+                    write_batch(vectorstore, batch, batch_ids, embeddings)
+                if on_batch is not None:
+                    on_batch(batch, batch_ids, embeddings)
+                written += len(batch)
+                num_batches += 1
+        elapsed = time.perf_counter() - start
+        return {
+            "chunks": written,
+            "batches": num_batches,
+            "retries": self._retries,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(written / elapsed, 2) if elapsed > 0 else None,
+        }
+
+def write_batch(vectorstore, documents, ids, embeddings):
+    # Chroma rejects empty metadata dicts, so rows without metadata go in a separate upsert (as Chroma.add_texts does)
+    with_metadata = [i for i, doc in enumerate(documents) if doc.metadata]
+    without_metadata = [i for i, doc in enumerate(documents) if not doc.metadata]
+    for indices in (with_metadata, without_metadata):
+        if not indices:
+            continue
+        rows = {
+            "ids": [ids[i] for i in indices],
+            "embeddings": [list(embeddings[i]) for i in indices],
+            "documents": [documents[i].page_content for i in indices],
+        }
+        if indices is with_metadata:
+            rows["metadatas"] = [documents[i].metadata for i in indices]
+        vectorstore._collection.upsert(**rows)
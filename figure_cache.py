@@ -0,0 +1,79 @@
+import io
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+# ________________________________________________________FIGURE CACHE____________________________________________
+# Built charts keyed by (dataset fingerprint, plot type, x, y, options); bounded by count and by approximate size
+MAX_ENTRIES = 32
+MAX_BYTES = 64 * 1024 * 1024
+
+def figure_size(figure):
+    # Serialized size is what the browser receives and a fair proxy for what the cached figure holds
+    if isinstance(figure, (bytes, bytearray)):
+        return len(figure)
+    if isinstance(figure, io.BytesIO):
+        return figure.getbuffer().nbytes
+    return len(pio.to_json(figure, validate=False))
+
+class FigureCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["figure"]
+
+    def peek(self, key):
+        # For redrawing a chart already on screen: keeps it recent but is not counted as a hit or a miss
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry["figure"]
+
+    def __contains__(self, key):
+        # Membership test that leaves hit counts and recency alone
+        with self._lock:
+            return key in self.entries
+
+    def put(self, key, figure):
+        size = figure_size(figure)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous["size"]
+            self.entries[key] = {"figure": figure, "size": size}
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted["size"]
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,141 @@
+import codecs
+import csv
+import hashlib
+import io
+import chardet
+import pandas as pd
+import streamlit as st
+from dataset_store import has_dataset, has_upload, load_schema, open_dataset, save_dataset, save_schema, save_upload
+from schema_inference import apply_schema, infer_schema
+from fingerprint import register_fingerprint
+try:
+    import pyarrow  # noqa: F401  (enables pandas' multi-threaded pyarrow CSV engine)
+except ImportError:
+    pyarrow = None
+# ________________________________________________________UPLOAD LOADER____________________________________________
+# Encoding and dialect are guessed from a bounded prefix instead of the whole upload
+SAMPLE_BYTES = 64 * 1024
+SNIFF_CHARS = 16 * 1024
+# UTF-8 validation walks the upload in blocks of this size, so it never holds a decoded copy of the whole file
+VALIDATE_BLOCK_BYTES = 16 * 1024 * 1024
+# chardet guesses on a few accented words are close to random; below this confidence assume Windows-1252
+MIN_DETECT_CONFIDENCE = 0.8
+MAX_CACHED_FILES = 4
+
+def content_hash(buffer):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(buffer)
+    return digest.hexdigest()
+
+def utf8_error_offset(data):
+    # Offset of the first byte that is not valid UTF-8, or None; a strict decode is cheap next to parsing the file
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(data)
+    for start in range(0, len(view), VALIDATE_BLOCK_BYTES):
+        try:
+            decoder.decode(view[start:start + VALIDATE_BLOCK_BYTES], final=start + VALIDATE_BLOCK_BYTES >= len(view))
+        except UnicodeDecodeError as e:
+            return start + e.start
+    return None
+
+def detect_encoding(data):
+    # A clean prefix proves nothing about accented text further down, so the whole upload is checked
+    if bytes(data[:3]) == codecs.BOM_UTF8:
+        return "utf-8-sig"
+    offset = utf8_error_offset(data)
+    if offset is None:
+        return "utf-8"
+    # Not UTF-8: let chardet look at the bytes around the first non-UTF-8 one
+    window = bytes(data[max(0, offset - SAMPLE_BYTES // 2):offset + SAMPLE_BYTES // 2])
+    detected = chardet.detect(window)
+    encoding = detected["encoding"]
+    if not encoding or (detected["confidence"] or 0) < MIN_DETECT_CONFIDENCE or encoding.lower().replace("-", "") in ("ascii", "utf8"):
+        return "cp1252"
+    return encoding
+
+def has_binary_column(df):
+    # pyarrow turns text it cannot decode into bytes objects instead of raising
+    for col in df.select_dtypes(include="object").columns:
+        values = df[col].dropna()
+        if len(values) and isinstance(values.iloc[0], bytes):
+            return True
+    return False
+
+def sniff_delimiter(sample, encoding):
+    text = sample.decode(encoding, errors="ignore")[:SNIFF_CHARS]
+    # Drop the last line, which the byte cut-off has probably truncated
+    if "\n" in text:
+        text = text[:text.rfind("\n")]
+    try:
+        return csv.Sniffer().sniff(text, delimiters=[',', ';']).delimiter
+    except csv.Error:
+        return ','
+
+def read_csv(source, encoding, delimiter, engine=None):
+    engine = engine or ("pyarrow" if pyarrow is not None else "c")
+    if engine == "pyarrow":
+        try:
+            df = pd.read_csv(source, encoding=encoding, delimiter=delimiter, engine="pyarrow")
+            if not has_binary_column(df):
+                return df
+        except Exception:
+            # Ragged rows and other quirks the pyarrow parser rejects; the C parser is more forgiving
+            pass
+        source.seek(0)
+    return pd.read_csv(source, encoding=encoding, delimiter=delimiter, low_memory=False)
+
+def parse_file(name, data):
+    if name.endswith('.csv'):
+        encoding = detect_encoding(data)
+        delimiter = sniff_delimiter(bytes(data[:SAMPLE_BYTES]), encoding)
+        return read_csv(io.BytesIO(data), encoding, delimiter)
+    elif name.endswith('.xlsx'):
+        return pd.read_excel(io.BytesIO(data), engine='openpyxl')
+    raise ValueError(f"Unsupported file type: {name}")
+
+def uploaded_file_key(uploaded_file):
+    # Hash each upload once per session; hashing 200 MB on every rerun would cost as much as the cache saves
+    hashes = st.session_state.setdefault("upload_hashes", {})
+    upload_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    if upload_id not in hashes:
+        with uploaded_file.getbuffer() as view:
+            hashes[upload_id] = content_hash(view)
+    return hashes[upload_id]
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES, show_spinner="Reading file...")
+def load_uploaded_file(name, key, _uploaded_file):
+    # Cached by content hash and shared across reruns and sessions: callers must not mutate the frame in place
+    if has_dataset(key):
+        return open_dataset(key)
+    df = parse_file(name, _uploaded_file.getvalue())
+    # Dates and categories are inferred once per content hash
+    schema = load_schema(key)
+    if schema is None:
+        schema = infer_schema(df)
+        save_schema(key, schema)
+    df = apply_schema(df, schema)
+    try:
+        save_dataset(key, name, df)
+    except Exception:
+        # The columnar copy is only an accelerator; the parsed frame is still usable
+        pass
+    return register_fingerprint(df, key)
+
+def stage_upload(name, key, uploaded_file):
+    # SQL mode: DuckDB scans the Parquet copy, or else a copy of the raw CSV, so no DataFrame is built.
+    # DuckDB reads UTF-8, so other encodings are converted once here. Excel files still go through pandas.
+    if has_dataset(key) or has_upload(key):
+        return True
+    if not name.endswith('.csv'):
+        return False
+    with uploaded_file.getbuffer() as data:
+        encoding = detect_encoding(data)
+        if encoding == "utf-8":
+            save_upload(key, name, data)
+        else:
+            save_upload(key, name, bytes(data).decode(encoding).encode("utf-8"))
+    return True
+
+@st.cache_resource(max_entries=MAX_CACHED_FILES, show_spinner="Opening dataset...")
+def load_stored_dataset(key):
+    return open_dataset(key)
@@ -0,0 +1,163 @@
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from tracing import CHARS_PER_TOKEN, current_span, estimate_tokens
+# ________________________________________________________HYBRID RETRIEVAL____________________________________________
+# Keyword (BM25) and vector hits are fused and reranked locally, the number of chunks follows the gaps in the fused
+# scores and the stuffed context is cut to a token budget, so the prompt only carries what the question needs
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_MODES = ("hybrid", "vector")
+# Hits taken from each side before fusion
+CANDIDATES = 20
+MIN_CHUNKS = 1
+MAX_CHUNKS = 5
+# Share of the fused score that comes from vector similarity; the rest is BM25
+VECTOR_WEIGHT = 0.5
+# Chunks below this fraction of the best score are dropped, and so is everything after a drop larger than MAX_SCORE_GAP
+MIN_SCORE_RATIO = 0.5
+MAX_SCORE_GAP = 0.25
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "1500"))
+# A trimmed chunk shorter than this is not worth the tokens
+MIN_TRIMMED_TOKENS = 50
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+if RETRIEVAL_MODE not in RETRIEVAL_MODES:
+    raise ValueError(f"Unknown RETRIEVAL_MODE: {RETRIEVAL_MODE}. Choose one of {RETRIEVAL_MODES}")
+
+def tokenize(text):
+    # \w covers Vietnamese letters with diacritics as well as English
+    return re.findall(r"\w+", str(text).casefold())
+
+def chunk_key(doc):
+    # The same chunk comes back from both searches as separate Document objects
+    return doc.metadata.get("source"), doc.page_content
+
+class BM25Index:
+    # Okapi BM25 over one collection's chunks, with postings stored as arrays so a query touches only its own terms
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.documents = list(documents)
+        self.doc_ids = [doc.metadata.get("doc_id") for doc in self.documents]
+        self.k1 = k1
+        postings = {}
+        lengths = np.zeros(len(self.documents))
+        for i, doc in enumerate(self.documents):
+            counts = Counter(tokenize(doc.page_content))
+            lengths[i] = sum(counts.values())
+            for term, count in counts.items():
+                rows, tfs = postings.setdefault(term, ([], []))
+                rows.append(i)
+                tfs.append(count)
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        self.norms = k1 * (1 - b + b * lengths / average_length)
+        n = len(self.documents)
+        self.postings = {
+            term: (np.array(rows), np.array(tfs, dtype=float), math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5)))
+            for term, (rows, tfs) in postings.items()
+        }
+
+    def __len__(self):
+        return len(self.documents)
+
+    def scores(self, query):
+        scores = np.zeros(len(self.documents))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            rows, tfs, idf = posting
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self.norms[rows])
+        return scores
+
+    def search(self, query, k=CANDIDATES, doc_ids=None):
+        scores = self.scores(query)
+        if doc_ids is not None:
+            allowed = set(doc_ids)
+            scores[np.array([doc_id not in allowed for doc_id in self.doc_ids], dtype=bool)] = 0.0
+        hits = np.flatnonzero(scores > 0)
+        top = hits[np.argsort(-scores[hits], kind="stable")[:k]]
+        return [(self.documents[i], float(scores[i])) for i in top]
+
+def normalize_scores(scores):
+    # Min-max within one result list, so BM25 and vector scores share a 0..1 scale
+    scores = np.asarray(scores, dtype=float)
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+def fuse(vector_hits, keyword_hits, vector_weight=VECTOR_WEIGHT):
+    # vector_hits carry Chroma distances (lower is closer), keyword_hits BM25 scores; returns (doc, score), best first
+    pool = {}
+    for (doc, _), score in zip(vector_hits, normalize_scores([-distance for _, distance in vector_hits])):
+        pool.setdefault(chunk_key(doc), [doc, 0.0, 0.0])[1] = score
+    for (doc, _), score in zip(keyword_hits, normalize_scores([score for _, score in keyword_hits])):
+        pool.setdefault(chunk_key(doc), [doc, 0.0, 0.0])[2] = score
+    ranked = [(doc, vector_weight * vector + (1 - vector_weight) * keyword) for doc, vector, keyword in pool.values()]
+    ranked.sort(key=lambda hit: hit[1], reverse=True)
+    return ranked
+
+def adaptive_cutoff(scores, min_chunks=MIN_CHUNKS, max_chunks=MAX_CHUNKS, min_ratio=MIN_SCORE_RATIO, max_gap=MAX_SCORE_GAP):
+    # How many of the ranked hits to keep: a clear winner is sent alone, a flat top of the ranking keeps up to max_chunks
+    if not len(scores):
+        return 0
+    best = scores[0]
+    keep = 1
+    while keep < min(len(scores), max_chunks):
+        if keep >= min_chunks and (scores[keep] < best * min_ratio or scores[keep - 1] - scores[keep] > max_gap * best):
+            break
+        keep += 1
+    return keep
+
+def trim_to_budget(documents, max_tokens=MAX_CONTEXT_TOKENS):
+    # Best chunks first; the chunk that crosses the budget is cut at a word boundary and the rest are dropped
+    kept = []
+    used = 0
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if used + tokens <= max_tokens:
+            kept.append(doc)
+            used += tokens
+            continue
+        remaining = max_tokens - used
+        if remaining >= MIN_TRIMMED_TOKENS or not kept:
+            text = doc.page_content[:remaining * CHARS_PER_TOKEN].rsplit(" ", 1)[0]
+            kept.append(Document(page_content=text, metadata={**doc.metadata, "trimmed": True}))
+        break
+    return kept
+
+def hybrid_search(question, vectorstore, keyword_index, where=None, doc_ids=None, candidates=CANDIDATES,
+                  max_chunks=MAX_CHUNKS, max_tokens=MAX_CONTEXT_TOKENS):
+    vector_hits = vectorstore.similarity_search_with_score(question, k=candidates, filter=where)
+    keyword_hits = keyword_index.search(question, candidates, doc_ids)
+    ranked = fuse(vector_hits, keyword_hits)
+    keep = adaptive_cutoff([score for _, score in ranked], max_chunks=max_chunks)
+    documents = trim_to_budget([doc for doc, _ in ranked[:keep]], max_tokens)
+    current_span().set(**{
+        "retrieval.vector_hits": len(vector_hits),
+        "retrieval.keyword_hits": len(keyword_hits),
+        "retrieval.chunks": len(documents),
+        "retrieval.context_tokens": sum(estimate_tokens(doc.page_content) for doc in documents),
+    })
+    return documents
+
+class HybridRetriever(BaseRetriever):
+    # Drop-in retriever for RetrievalQA and RetrievalEngine.stream
+    vectorstore: Any
+    keyword_index: Any
+    where: Optional[dict] = None
+    doc_ids: Optional[List[str]] = None
+    candidates: int = CANDIDATES
+    max_chunks: int = MAX_CHUNKS
+    max_tokens: int = MAX_CONTEXT_TOKENS
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return hybrid_search(query, self.vectorstore, self.keyword_index, where=self.where, doc_ids=self.doc_ids,
+                             candidates=self.candidates, max_chunks=self.max_chunks, max_tokens=self.max_tokens)
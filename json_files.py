@@ -0,0 +1,23 @@
+import json
+import os
+import threading
+# ________________________________________________________JSON STATE FILES____________________________________________
+# Manifests, indexes and registries are small JSON files replaced atomically: a reader sees the old or the new
+# version, never a half-written one
+
+def read_json(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Per-writer temp file, so two threads saving the same file never write into each other's copy
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
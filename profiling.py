@@ -0,0 +1,183 @@
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+import numpy as np
+import pandas as pd
+from data_analysis import OUTLIER_METHODS, count_outliers, numeric_columns
+from tracing import current_span, traced
+# ________________________________________________________PROFILING ENGINE____________________________________________
+SAMPLE_SIZE = 100_000
+# "auto" switches to sampling above this many rows
+APPROXIMATE_ROWS = 5_000_000
+# Below this many cells a process pool costs more than it saves
+PARALLEL_MIN_CELLS = 5_000_000
+CONFIDENCE_Z = 1.96
+CONFIDENCE_DELTA = 0.05
+
+@dataclass
+class ColumnProfile:
+    name: str
+    dtype: str
+    null_count: int
+    outlier_count: int = None
+    # Half-width of the 95% interval around the counts; 0 when they were computed exactly
+    null_error: int = 0
+    outlier_error: int = 0
+    q1: float = None
+    q3: float = None
+
+@dataclass
+class DatasetProfile:
+    rows: int
+    num_columns: int
+    mode: str
+    outlier_method: str
+    columns: list = field(default_factory=list)
+    sample_size: int = None
+    # Rank error of the sampled quartiles: each is within this fraction of rows of the true quantile (95%)
+    quantile_rank_error: float = None
+    elapsed_seconds: float = None
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_text(self):
+        approximate = self.mode == "approximate"
+
+        def count(value, error):
+            if value is None:
+                return "-"
+            return f"≈ {value} ± {error}" if approximate else f"{value}"
+
+        dataset_info = f"Dataset Info:\n- Number of rows: {self.rows} : - Number of columns: {self.num_columns}\n"
+        if approximate:
+            dataset_info += f"- Approximate profile from a sample of {self.sample_size} rows (95% confidence)\n"
+        dataset_info += "\n"
+        dtypes = pd.Series({col.name: col.dtype for col in self.columns}, dtype="object")
+        dataset_info += "Data Types of Columns:\n" + dtypes.apply(lambda x: f": {x}").to_string() + "\n\n"
+        nulls = pd.Series({col.name: count(col.null_count, col.null_error) for col in self.columns}, dtype="object")
+        dataset_info += "Null Values per Column:\n" + nulls.apply(lambda x: f": {x}").to_string() + "\n\n"
+        outlier_columns = [col for col in self.columns if col.outlier_count is not None]
+        if outlier_columns:
+            outliers_info = "\n".join(f"{col.name}: {count(col.outlier_count, col.outlier_error)} outliers" for col in outlier_columns)
+        else:
+            outliers_info = "No outliers detected."
+        dataset_info += f"\nOutliers Summary:\n{outliers_info}"
+        return dataset_info
+
+def quartile(quartiles, q, col):
+    # An all-NA nullable column has pd.NA quartiles, which float() rejects
+    value = quartiles.loc[q, col]
+    return None if pd.isna(value) else float(value)
+
+# ____________________________SAMPLING____________________________
+def stratified_sample(df, by, size=SAMPLE_SIZE, seed=0):
+    # Proportional allocation, topped up with one row from any stratum the sample missed so rare groups are not lost.
+    # Rows are grouped by position on factorized codes: nulls share code -1 and form a stratum of their own, which
+    # groupby(dropna=False) cannot look up for category and nullable string columns.
+    fraction = min(1.0, size / max(len(df), 1))
+    codes = pd.factorize(df[by])[0]
+    grouped = pd.Series(np.arange(len(df))).groupby(codes)
+    sampled = grouped.sample(frac=fraction, random_state=seed).to_numpy()
+    firsts = grouped.head(1).to_numpy()
+    missed = firsts[~np.isin(codes[firsts], codes[sampled])]
+    return df.iloc[np.concatenate([sampled, missed])]
+
+def proportion_error(successes, sample_size, population):
+    # Normal-approximation interval for a count estimated from a simple random sample, with finite population correction
+    if sample_size == 0 or population == 0:
+        return 0
+    p = successes / sample_size
+    fpc = math.sqrt((population - sample_size) / (population - 1)) if population > 1 else 0.0
+    return int(math.ceil(CONFIDENCE_Z * math.sqrt(p * (1 - p) / sample_size) * fpc * population))
+
+def quantile_rank_error(sample_size):
+    # Dvoretzky-Kiefer-Wolfowitz bound on the rank error of sample quantiles
+    if sample_size == 0:
+        return None
+    return math.sqrt(math.log(2 / CONFIDENCE_DELTA) / (2 * sample_size))
+
+def approximate_profile(df, sample_size=SAMPLE_SIZE, outlier_method="iqr", stratify_by=None, seed=0):
+    # Counts and quartiles come from one sample of the loaded frame; quartiles are plain sample quantiles whose rank
+    # error is bounded by quantile_rank_error rather than a streaming sketch
+    rows = len(df)
+    if stratify_by is not None:
+        sample = stratified_sample(df, stratify_by, sample_size, seed)
+    elif rows > sample_size:
+        sample = df.sample(n=sample_size, random_state=seed)
+    else:
+        sample = df
+    n = len(sample)
+    scale = rows / n if n else 0
+    sample_nulls = sample.isnull().sum()
+    numeric = sample[numeric_columns(sample)]
+    outliers = count_outliers(sample, outlier_method)
+    quartiles = numeric.quantile([0.25, 0.75]) if numeric.shape[1] else None
+    columns = []
+    for col in sample.columns:
+        null_count = int(round(sample_nulls[col] * scale))
+        null_error = proportion_error(int(sample_nulls[col]), n, rows)
+        profile = ColumnProfile(name=str(col), dtype=str(sample[col].dtype), null_count=null_count, null_error=null_error)
+        if col in outliers.index:
+            profile.outlier_count = int(round(outliers[col] * scale))
+            # Covers the sampling error of the count; the bounds themselves come from the sampled quartiles
+            profile.outlier_error = proportion_error(int(outliers[col]), n, rows)
+            profile.q1 = quartile(quartiles, 0.25, col)
+            profile.q3 = quartile(quartiles, 0.75, col)
+        columns.append(profile)
+    return DatasetProfile(
+        rows=rows,
+        num_columns=len(sample.columns),
+        mode="approximate",
+        outlier_method=outlier_method,
+        columns=columns,
+        sample_size=n,
+        quantile_rank_error=quantile_rank_error(n),
+    )
+
+# ____________________________EXACT____________________________
+def profile_columns(frame, outlier_method):
+    # Module-level so it can be pickled into the process pool
+    numeric = frame[numeric_columns(frame)]
+    quartiles = numeric.quantile([0.25, 0.75]) if numeric.shape[1] else None
+    return frame.isnull().sum(), count_outliers(frame, outlier_method), quartiles
+
+def exact_profile(df, outlier_method="iqr", max_workers=None):
+    max_workers = max_workers or min(os.cpu_count() or 1, 8)
+    if df.size < PARALLEL_MIN_CELLS or max_workers == 1 or df.shape[1] == 1:
+        parts = [profile_columns(df, outlier_method)]
+    else:
+        groups = [list(group) for group in np.array_split(np.arange(df.shape[1]), min(max_workers, df.shape[1]))]
+        with ProcessPoolExecutor(max_workers=len(groups)) as pool:
+            parts = list(pool.map(profile_columns, [df.iloc[:, group] for group in groups], [outlier_method] * len(groups)))
+    nulls = pd.concat([part[0] for part in parts])
+    outliers = pd.concat([part[1] for part in parts])
+    quartiles = pd.concat([part[2] for part in parts if part[2] is not None], axis=1) if any(part[2] is not None for part in parts) else None
+    columns = []
+    for col in df.columns:
+        profile = ColumnProfile(name=str(col), dtype=str(df[col].dtype), null_count=int(nulls[col]))
+        if col in outliers.index:
+            profile.outlier_count = int(outliers[col])
+            profile.q1 = quartile(quartiles, 0.25, col)
+            profile.q3 = quartile(quartiles, 0.75, col)
+        columns.append(profile)
+    return DatasetProfile(rows=len(df), num_columns=df.shape[1], mode="exact", outlier_method=outlier_method, columns=columns)
+
+@traced("data.profile_dataset")
+def profile_dataset(df, mode="auto", outlier_method="iqr", sample_size=SAMPLE_SIZE, stratify_by=None):
+    if outlier_method not in OUTLIER_METHODS:
+        raise ValueError(f"Unknown outlier method: {outlier_method}. Choose one of {OUTLIER_METHODS}")
+    start = time.perf_counter()
+    if mode == "auto":
+        mode = "approximate" if len(df) > APPROXIMATE_ROWS else "exact"
+    current_span().set(rows=len(df), columns=df.shape[1], mode=mode)
+    if mode == "approximate":
+        profile = approximate_profile(df, sample_size=sample_size, outlier_method=outlier_method, stratify_by=stratify_by)
+    elif mode == "exact":
+        profile = exact_profile(df, outlier_method)
+    else:
+        raise ValueError(f"Unknown profiling mode: {mode}")
+    profile.elapsed_seconds = round(time.perf_counter() - start, 3)
+    return profile
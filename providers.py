@@ -0,0 +1,139 @@
+import hashlib
+import os
+import re
+import time
+from typing import Iterator, List
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from tracing import estimate_tokens
+# ________________________________________________________MODEL PROVIDERS____________________________________________
+# LLM_PROVIDER=fake swaps every model client for an offline stand-in with deterministic output and configurable latency,
+# so the app and benchmark.py can run without a Google API key or network access
+PROVIDER = os.getenv("LLM_PROVIDER", "google").lower()
+PROVIDERS = ("google", "fake")
+# Seconds before the first token / per prompt token read / between streamed tokens / per embedding request
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_PROMPT_TOKEN_LATENCY = float(os.getenv("FAKE_PROMPT_TOKEN_LATENCY", "0"))
+FAKE_TOKEN_LATENCY = float(os.getenv("FAKE_TOKEN_LATENCY", "0"))
+FAKE_EMBEDDING_LATENCY = float(os.getenv("FAKE_EMBEDDING_LATENCY", "0"))
+FAKE_RESPONSE_WORDS = 60
+EMBEDDING_SIZE = 768
+# pandasai executes what the LLM returns, so the stand-in answers with code that works on any dataset
+FAKE_PANDASAI_CODE = 'result = {"type": "dataframe", "value": dfs[0].head(10)}'
+
+if PROVIDER not in PROVIDERS:
+    raise ValueError(f"Unknown LLM_PROVIDER: {PROVIDER}. Choose one of {PROVIDERS}")
+
+def use_fake_provider():
+    return PROVIDER == "fake"
+
+def fake_response(prompt, words=FAKE_RESPONSE_WORDS):
+    # Same prompt -> same answer; built from the prompt's own words so it reads like a reply to it
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    vocabulary = re.findall(r"\w+", prompt) or ["answer"]
+    start = int(digest[:8], 16)
+    return f"[{digest[:8]}] " + " ".join(vocabulary[(start + i * 7) % len(vocabulary)] for i in range(words))
+
+# ____________________________FAKE BACKENDS____________________________
+class FakeChatModel(SimpleChatModel):
+    # LangChain chat model for RetrievalQA and RetrievalEngine.stream
+    latency_seconds: float = FAKE_LLM_LATENCY
+    # Longer prompts take longer to read, which is what trimming the retrieved context saves
+    prompt_token_latency_seconds: float = FAKE_PROMPT_TOKEN_LATENCY
+    token_latency_seconds: float = FAKE_TOKEN_LATENCY
+    words: int = FAKE_RESPONSE_WORDS
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_seconds + self.prompt_token_latency_seconds * estimate_tokens(messages[-1].content))
+        time.sleep(self.token_latency_seconds * self.words)
+        return fake_response(messages[-1].content, self.words)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_seconds + self.prompt_token_latency_seconds * estimate_tokens(messages[-1].content))
+        for i, word in enumerate(fake_response(messages[-1].content, self.words).split(" ")):
+            if i:
+                time.sleep(self.token_latency_seconds)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
+
+class FakeEmbeddings(Embeddings):
+    # Deterministic vectors plus a fixed per-request delay standing in for the embedding API round trip
+    def __init__(self, latency_seconds=FAKE_EMBEDDING_LATENCY, size=EMBEDDING_SIZE):
+        self.latency_seconds = latency_seconds
+        self.embedding = DeterministicFakeEmbedding(size=size)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_seconds)
+        return self.embedding.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_seconds)
+        return self.embedding.embed_query(text)
+
+class FakeGenerationResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    # Mirrors the parts of google.generativeai.GenerativeModel the app uses: generate_content with and without stream
+    def __init__(self, latency_seconds=FAKE_LLM_LATENCY, token_latency_seconds=FAKE_TOKEN_LATENCY, words=FAKE_RESPONSE_WORDS):
+        self.latency_seconds = latency_seconds
+        self.token_latency_seconds = token_latency_seconds
+        self.words = words
+
+    def _chunks(self, text):
+        time.sleep(self.latency_seconds)
+        for i, word in enumerate(text.split(" ")):
+            if i:
+                time.sleep(self.token_latency_seconds)
+            yield FakeGenerationResponse(word if i == 0 else f" {word}")
+
+    def generate_content(self, prompt, stream=False):
+        text = fake_response(str(prompt), self.words)
+        if stream:
+            return self._chunks(text)
+        time.sleep(self.latency_seconds + self.token_latency_seconds * self.words)
+        return FakeGenerationResponse(text)
+
+def fake_pandasai_llm(latency_seconds=FAKE_LLM_LATENCY, code=FAKE_PANDASAI_CODE):
+    from pandasai.llm.fake import FakeLLM
+
+    class LatencyFakeLLM(FakeLLM):
+        def call(self, instruction, context=None):
+            time.sleep(latency_seconds)
+            return super().call(instruction, context)
+
+    return LatencyFakeLLM(output=code)
+
+# ____________________________FACTORIES____________________________
+# Google clients are imported lazily so the fake provider works without the Google SDKs
+def chat_model(model, temperature=0, google_api_key=None):
+    if use_fake_provider():
+        return FakeChatModel()
+    from langchain_google_genai.chat_models import ChatGoogleGenerativeAI
+    kwargs = {"google_api_key": google_api_key} if google_api_key else {}
+    return ChatGoogleGenerativeAI(model=model, temperature=temperature, **kwargs)
+
+def embeddings(model):
+    if use_fake_provider():
+        return FakeEmbeddings()
+    from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=model)
+
+def generative_model(model, api_key=None):
+    if use_fake_provider():
+        return FakeGenerativeModel()
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model)
+
+def pandasai_llm(api_key=None):
+    if use_fake_provider():
+        return fake_pandasai_llm()
+    from pandasai.llm import GoogleGemini
+    return GoogleGemini(api_key=api_key)
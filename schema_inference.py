@@ -0,0 +1,89 @@
+import warnings
+from collections import Counter
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+# ________________________________________________________SCHEMA INFERENCE____________________________________________
+# Inference looks at an evenly spaced sample; the full column is only touched once, by a vectorized conversion
+SAMPLE_SIZE = 1000
+FORMAT_CANDIDATES = 20
+# A column only becomes datetime if the inferred format parses this share of its values
+DATE_MATCH_RATIO = 0.95
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_RATIO = 0.5
+# Integer columns are left at their parsed width: int8/int16 overflow silently in pandas arithmetic (units * price)
+# and raise in DuckDB, which reads the same types from the Parquet copy
+
+def column_sample(series, size=SAMPLE_SIZE):
+    values = series.dropna()
+    if len(values) > size:
+        values = values.iloc[::len(values) // size]
+    return values
+
+def infer_datetime_format(sample):
+    # Guess a format from a handful of values (both day orders), keep the one that parses the most of the sample
+    texts = sample.astype(str)
+    candidates = Counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for value in texts.iloc[:FORMAT_CANDIDATES]:
+            for dayfirst in (False, True):
+                fmt = guess_datetime_format(value, dayfirst=dayfirst)
+                if fmt is not None:
+                    candidates[fmt] += 1
+    best_format, best_ratio = None, 0.0
+    for fmt, _ in candidates.most_common():
+        ratio = pd.to_datetime(texts, format=fmt, errors="coerce").notna().mean()
+        if ratio > best_ratio:
+            best_format, best_ratio = fmt, ratio
+    if best_ratio >= DATE_MATCH_RATIO:
+        return best_format
+    return None
+
+def infer_column(series):
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return None
+    sample = column_sample(series)
+    if sample.empty or not sample.map(lambda value: isinstance(value, str)).all():
+        return None
+    fmt = infer_datetime_format(sample)
+    if fmt is not None:
+        return {"kind": "datetime", "format": fmt}
+    unique = sample.nunique()
+    if unique <= CATEGORY_MAX_UNIQUE and unique <= CATEGORY_MAX_RATIO * len(sample):
+        return {"kind": "category"}
+    return None
+
+def infer_schema(df, kinds=("datetime", "category")):
+    schema = {}
+    for col in df.columns:
+        spec = infer_column(df[col])
+        if spec is not None and spec["kind"] in kinds:
+            schema[str(col)] = spec
+    return schema
+
+def apply_schema(df, schema):
+    # Returns a new frame; columns whose conversion would lose data keep their original values.
+    # Specs of other kinds (such as "integer" in schemas saved by older versions) are ignored.
+    converted = {}
+    for col in df.columns:
+        spec = schema.get(str(col))
+        if spec is None:
+            continue
+        series = df[col]
+        if spec["kind"] == "datetime":
+            parsed = pd.to_datetime(series, format=spec["format"], errors="coerce")
+            # The sample can miss values in another format; refuse rather than silently blank them out
+            lost = parsed.isna().sum() - series.isna().sum()
+            if lost <= (1 - DATE_MATCH_RATIO) * max(series.notna().sum(), 1):
+                converted[col] = parsed
+        elif spec["kind"] == "category":
+            if series.nunique() <= CATEGORY_MAX_UNIQUE:
+                converted[col] = series.astype("category")
+    if not converted:
+        return df
+    df = df.copy(deep=False)
+    for col, values in converted.items():
+        df[col] = values
+    return df
@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+import pandas as pd
+from dataset_store import dataset_path, has_dataset, has_upload, pin, unpin, upload_path
+from tracing import span
+try:
+    import duckdb
+    import pyarrow as pa
+except ImportError:
+    duckdb = None
+# ________________________________________________________SQL ENGINE____________________________________________
+# Generated SQL runs in DuckDB over the dataset's Parquet copy: the file is scanned in parallel, column by column and in
+# batches, so aggregations over reports larger than RAM never load them into pandas. Results come back as Arrow pages.
+TABLE_NAME = "data"
+THREADS = os.cpu_count() or 1
+MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT", "2GB")
+# Joins and aggregations that outgrow MEMORY_LIMIT spill here
+TEMP_PATH = "db/duckdb_tmp"
+PAGE_ROWS = 1000
+PREVIEW_ROWS = 100
+# Rows transferred out of DuckDB per query; the rest of a larger result is never fetched
+MAX_RESULT_ROWS = 100_000
+MAX_DATABASES = 4
+SQL_PROMPT = """Write one DuckDB SQL SELECT query that answers the question below.
+The data is in the table {table} with columns: {columns}.
+Return only the SQL.
+Question: '{question}'"""
+_databases = OrderedDict()
+_databases_lock = threading.Lock()
+
+class SQLValidationError(ValueError):
+    pass
+
+def sql_available():
+    return duckdb is not None
+
+def extract_sql(text):
+    # Models wrap the query in ```sql fences and often add an explanation around it
+    match = re.search(r"```(?:sql)?\s*(.*?)```", text, re.S | re.I)
+    return (match.group(1) if match else text).strip().rstrip(";").strip()
+
+def validate_sql(text):
+    # DuckDB's own parser decides what the statement is; string matching would miss "WITH ... DELETE" and friends
+    sql = extract_sql(text)
+    if not sql:
+        raise SQLValidationError("The model did not return any SQL")
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.Error as e:
+        raise SQLValidationError(f"Invalid SQL: {e}") from e
+    if len(statements) != 1:
+        raise SQLValidationError("Only a single SQL statement can be run")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise SQLValidationError("Only SELECT queries (including WITH ... SELECT) can be run")
+    return sql
+
+def quote_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+def dataset_source(key, df=None):
+    # The Parquet copy when there is one, then the raw CSV staged by SQL mode; otherwise the in-memory frame is scanned
+    # in place (vectorized, but not out-of-core)
+    if has_dataset(key):
+        return dataset_path(key)
+    if has_upload(key):
+        return upload_path(key)
+    if df is not None:
+        return df
+    raise FileNotFoundError(f"No stored copy of dataset {key}")
+
+@dataclass
+class QueryResult:
+    sql: str
+    table: "pa.Table"
+    truncated: bool
+    elapsed_seconds: float
+    page_rows: int = PAGE_ROWS
+
+    @property
+    def num_rows(self):
+        return self.table.num_rows
+
+    @property
+    def pages(self):
+        return max(1, -(-self.table.num_rows // self.page_rows))
+
+    def page(self, number):
+        # Zero-copy slice; only the requested page is converted to pandas
+        return self.table.slice(number * self.page_rows, self.page_rows).to_pandas()
+
+    def summary(self):
+        rows = f"first {self.num_rows:,} rows" if self.truncated else f"{self.num_rows:,} rows"
+        return f"{rows} in {self.elapsed_seconds:.2f}s"
+
+class DatasetDatabase:
+    # One in-memory DuckDB database per dataset, exposing it as the view TABLE_NAME and nothing else.
+    # key, when given, is the dataset store entry whose file the view reads; it stays pinned until close().
+    def __init__(self, source, key=None):
+        os.makedirs(TEMP_PATH, exist_ok=True)
+        temp_path = os.path.abspath(TEMP_PATH)
+        self.con = duckdb.connect(config={
+            "threads": THREADS,
+            "memory_limit": MEMORY_LIMIT,
+            "temp_directory": temp_path,
+            # Otherwise a query could read any pandas frame in scope by naming its variable
+            "python_enable_replacements": False,
+        })
+        allowed = []
+        self.key = key
+        self.in_memory = isinstance(source, pd.DataFrame)
+        self._lock = threading.Lock()
+        # Queries running right now; a database evicted from the LRU is closed by the last of them
+        self._state_lock = threading.Lock()
+        self.users = 0
+        self.retired = False
+        if self.in_memory:
+            self.con.register(TABLE_NAME, source)
+        else:
+            path = os.path.abspath(source)
+            reader = "read_parquet" if path.endswith(".parquet") else "read_csv_auto"
+            self.con.execute(f"CREATE VIEW {TABLE_NAME} AS SELECT * FROM {reader}({quote_literal(path)})")
+            allowed.append(path)
+        # Generated SQL can read the dataset and spill to the temp directory, but cannot touch any other file
+        self.con.execute(f"SET allowed_paths = [{', '.join(map(quote_literal, allowed))}]")
+        self.con.execute(f"SET allowed_directories = [{quote_literal(temp_path)}]")
+        self.con.execute("SET enable_external_access = false")
+        self.con.execute("SET lock_configuration = true")
+
+    @contextmanager
+    def cursor(self):
+        # A cursor per query lets sessions query a file-backed dataset from different threads. A registered frame is
+        # only visible to the connection it was registered on, so queries over one take turns on that connection.
+        if self.in_memory:
+            with self._lock:
+                yield self.con
+            return
+        cursor = self.con.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def columns(self):
+        with self.cursor() as cursor:
+            return [(row[0], row[1]) for row in cursor.execute(f"DESCRIBE {TABLE_NAME}").fetchall()]
+
+    def preview(self, rows=PREVIEW_ROWS):
+        # Only the first rows are read, however large the file
+        with self.cursor() as cursor:
+            return cursor.execute(f"SELECT * FROM {TABLE_NAME} LIMIT {int(rows)}").df()
+
+    def execute(self, sql, max_rows=MAX_RESULT_ROWS, page_rows=PAGE_ROWS):
+        start = time.perf_counter()
+        with self.cursor() as cursor:
+            reader = cursor.execute(sql).to_arrow_reader(page_rows)
+            batches = []
+            rows = 0
+            truncated = False
+            for batch in reader:
+                if rows + batch.num_rows > max_rows:
+                    batches.append(batch.slice(0, max_rows - rows))
+                    truncated = True
+                    break
+                batches.append(batch)
+                rows += batch.num_rows
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+        return QueryResult(sql, table, truncated, time.perf_counter() - start, page_rows)
+
+    def acquire(self):
+        with self._state_lock:
+            self.users += 1
+
+    def release(self):
+        with self._state_lock:
+            self.users -= 1
+            idle = self.retired and self.users == 0
+        if idle:
+            self.close()
+
+    def retire(self):
+        # Evicted while another session may still be querying it: closing now would fail that query
+        with self._state_lock:
+            self.retired = True
+            idle = self.users == 0
+        if idle:
+            self.close()
+
+    def close(self):
+        self.con.close()
+        if self.key is not None:
+            unpin(self.key)
+
+@contextmanager
+def get_database(key, df=None):
+    # The database stays open until the block exits, even if other datasets push it out of the LRU meanwhile
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            # Pinned before the file is looked up, so the dataset store cannot evict it in between
+            pin(key)
+            try:
+                database = _databases[key] = DatasetDatabase(dataset_source(key, df), key)
+            except Exception:
+                unpin(key)
+                raise
+        database.acquire()
+        _databases.move_to_end(key)
+        while len(_databases) > MAX_DATABASES:
+            _, evicted = _databases.popitem(last=False)
+            evicted.retire()
+    try:
+        yield database
+    finally:
+        database.release()
+
+def table_schema(key, df=None):
+    # For the SQL prompt: the model can only write a runnable query if it knows the table and column names
+    with get_database(key, df) as database:
+        return ", ".join(f'"{name}" {dtype}' for name, dtype in database.columns())
+
+def preview_dataset(key, rows=PREVIEW_ROWS):
+    with get_database(key) as database:
+        return database.preview(rows)
+
+def sql_prompt(input_text, schema):
+    return SQL_PROMPT.format(table=TABLE_NAME, columns=schema, question=input_text)
+
+def run_sql(key, text, df=None, max_rows=MAX_RESULT_ROWS):
+    with span("sql.execute") as current:
+        sql = validate_sql(text)
+        with get_database(key, df) as database:
+            result = database.execute(sql, max_rows=max_rows)
+        current.set(rows=result.num_rows, truncated=result.truncated)
+        return result
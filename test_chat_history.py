@@ -0,0 +1,14 @@
+import pandas as pd
+from chat_history import ChatHistory
+
+def test_two_tabs_on_one_session_keep_their_own_results(tmp_path):
+    tab_a = ChatHistory(root=str(tmp_path))
+    tab_b = ChatHistory(tab_a.session_id, root=str(tmp_path))
+    tab_a.append("q1", pd.DataFrame({"a": [1]}))
+    tab_b.append("q2", pd.DataFrame({"b": [2]}))
+    reopened = ChatHistory(tab_a.session_id, root=str(tmp_path))
+    assert [turn["input"] for turn in reopened.turns] == ["q1", "q2"]
+    assert len({turn["id"] for turn in reopened.turns}) == 2
+    assert list(reopened.load_response(reopened.turns[0]).columns) == ["a"]
+    assert list(reopened.load_response(reopened.turns[1]).columns) == ["b"]
+    assert len(tab_b) == 2
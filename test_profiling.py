@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from profiling import profile_dataset, stratified_sample
+
+def grouped_frame(dtype):
+    groups = ["a"] * 500 + ["b"] * 300 + [None] * 200
+    return pd.DataFrame({"g": pd.Series(groups, dtype=dtype), "x": np.arange(1000, dtype=float)})
+
+def test_stratified_sample_keeps_null_stratum():
+    for dtype in ("category", "string", "object"):
+        sample = stratified_sample(grouped_frame(dtype), "g", size=100)
+        assert sample["g"].isna().any()
+        assert set(sample["g"].dropna()) == {"a", "b"}
+
+def test_stratified_sample_keeps_rare_groups():
+    df = pd.DataFrame({"g": pd.Series(["a"] * 999 + ["rare"], dtype="category"), "x": range(1000)})
+    assert "rare" in set(stratified_sample(df, "g", size=10)["g"])
+
+def test_approximate_profile_stratified_by_category_with_nulls():
+    profile = profile_dataset(grouped_frame("category"), mode="approximate", stratify_by="g", sample_size=100)
+    nulls = {col.name: col.null_count for col in profile.columns}
+    assert nulls["g"] > 0
+
+def test_all_na_nullable_columns():
+    df = pd.DataFrame({
+        "i": pd.Series([pd.NA] * 50, dtype="Int64"),
+        "f": pd.Series([pd.NA] * 50, dtype="Float64"),
+        "x": np.arange(50, dtype=float),
+    })
+    for mode in ("exact", "approximate"):
+        for method in ("iqr", "zscore", "mad"):
+            profile = profile_dataset(df, mode=mode, outlier_method=method, sample_size=20)
+            columns = {col.name: col for col in profile.columns}
+            assert columns["i"].q1 is None and columns["f"].q3 is None
+            assert columns["i"].null_count == 50
+
+def test_timedelta_columns_are_not_profiled_as_numbers():
+    df = pd.DataFrame({"d": pd.to_timedelta(np.arange(50), unit="s"), "x": np.arange(50, dtype=float)})
+    columns = {col.name: col for col in profile_dataset(df, mode="exact").columns}
+    assert columns["d"].outlier_count is None
+    assert columns["x"].outlier_count == 0
@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("plotly")
+pytest.importorskip("seaborn")
+from Visualization import OTHER_LABEL, CategoricalEncoder
+
+def test_overflow_label_does_not_collide_with_kept_value():
+    values = ["other"] * 100 + [f"label{i}" for i in range(60)]
+    df = pd.DataFrame({"c": values})
+    encoder = CategoricalEncoder(drop_first=False)
+    encoded = encoder.fit_transform(df)
+    categories = encoder.categories["c"]
+    assert len(categories) == len(set(categories)) == 51
+    assert "other" in categories and encoder.other_labels["c"] != "other"
+    assert encoded["c_other"].sum() == 100
+    assert encoded[f"c_{encoder.other_labels['c']}"].sum() == 11
+
+def test_overflow_label_default():
+    df = pd.DataFrame({"c": [f"label{i}" for i in range(60)]})
+    encoder = CategoricalEncoder().fit(df)
+    assert encoder.other_labels["c"] == OTHER_LABEL
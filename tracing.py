@@ -0,0 +1,194 @@
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+# ________________________________________________________TRACING____________________________________________
+# Spans are kept in memory per trace (one trace per chat turn) and, with TRACE_EXPORT_PATH set, appended to a file as
+# OTLP/JSON lines (one ExportTraceServiceRequest per trace), which the OpenTelemetry collector's otlpjsonfile receiver reads
+TRACING_ENABLED = os.getenv("TRACING", "true").lower() == "true"
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+SERVICE_NAME = "data-assistant"
+MAX_TRACES = 100
+# Rough chars-per-token ratio for models that do not report usage
+CHARS_PER_TOKEN = 4
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str = None
+    start_ns: int = 0
+    end_ns: int = None
+    attributes: dict = field(default_factory=dict)
+    error: str = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+class _NoopSpan:
+    # Returned when tracing is off so call sites can still call .set()
+    def set(self, **attributes):
+        return self
+
+NOOP_SPAN = _NoopSpan()
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_span(span):
+    otlp = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items()],
+        # 1 = OK, 2 = ERROR
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        otlp["parentSpanId"] = span.parent_id
+    return otlp
+
+class Tracer:
+    def __init__(self, max_traces=MAX_TRACES, export_path=TRACE_EXPORT_PATH):
+        self.max_traces = max_traces
+        self.export_path = export_path
+        self.traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            spans = self.traces.setdefault(span.trace_id, [])
+            spans.append(span)
+            self.traces.move_to_end(span.trace_id)
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+        if span.parent_id is None and self.export_path:
+            self.export(span.trace_id)
+
+    def trace(self, trace_id):
+        with self._lock:
+            return sorted(self.traces.get(trace_id, []), key=lambda span: span.start_ns)
+
+    def export(self, trace_id, path=None):
+        path = path or self.export_path
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": otlp_value(SERVICE_NAME)}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [otlp_span(span) for span in self.trace(trace_id)]}],
+        }]}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+tracer = Tracer()
+
+@contextmanager
+def span(name, **attributes):
+    # Child of the current span if there is one, otherwise the root of a new trace
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        parent_id=parent.span_id if parent else None,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        tracer.record(current)
+
+def traced(name=None):
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+def in_current_context(fn):
+    # Thread pools do not inherit context variables; wrap the callable so its spans join the submitting trace
+    return functools.partial(contextvars.copy_context().run, fn)
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+def record_usage(target, prompt, output, usage=None):
+    # Gemini reports usage_metadata; anything else gets a character-based estimate
+    if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+        target.set(**{
+            "gen_ai.usage.input_tokens": int(usage.prompt_token_count),
+            "gen_ai.usage.output_tokens": int(usage.candidates_token_count or 0),
+        })
+    else:
+        target.set(**{
+            "gen_ai.usage.input_tokens": estimate_tokens(prompt),
+            "gen_ai.usage.output_tokens": estimate_tokens(output),
+            "gen_ai.usage.estimated": True,
+        })
+
+def breakdown(trace_id):
+    # Rows for the timing panel: depth-first order, indented by nesting, with each span's share of the root
+    spans = tracer.trace(trace_id)
+    children = {}
+    for item in spans:
+        children.setdefault(item.parent_id, []).append(item)
+    span_ids = {item.span_id for item in spans}
+    roots = [item for item in spans if item.parent_id not in span_ids]
+    total = sum(root.duration_ms for root in roots) or 1.0
+    rows = []
+
+    def walk(item, depth):
+        rows.append({
+            "span": "  " * depth + item.name,
+            "ms": round(item.duration_ms, 1),
+            "share": f"{item.duration_ms / total:.0%}",
+            "details": ", ".join(f"{key}={value}" for key, value in item.attributes.items()),
+        })
+        for child in children.get(item.span_id, []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return rows